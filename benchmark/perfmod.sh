@@ -38,18 +38,11 @@ echo "Benchmarks completed!"
 jube analyse bench_run
 jube result bench_run > ls1-bench.csv
 
-# Create models
+# Create models, all models of models.json are created by one process reading the results once
 rm -r models
 mkdir -p models
-for traversal in c08 c04 # slice ori hs mp
-do
-    python3 csv2extrap.py ls1-bench.csv models/cutoff-${traversal}.extrap -m time_compute -v cutoff -f density=0.5 ljcenters=1 traversal=${traversal}
-    python3 csv2extrap.py ls1-bench.csv models/density-${traversal}.extrap -m time_compute -v density -f cutoff=4 ljcenters=1 traversal=${traversal}
-    python3 csv2extrap.py ls1-bench.csv models/ljcenters-${traversal}.extrap -m time_compute -v ljcenters -f density=0.5 cutoff=4 traversal=${traversal}
-done
-
+python3 csv2model.py ls1-bench.csv models/models.json --spec models.json
 
-# TODO Call extrap with models
 # TODO Plot results?
 
 # TODO Two parameter models
\ No newline at end of file
@@ -5,7 +5,16 @@ import numpy as np
 import os
 import pandas as pd
 
-Parameters = namedtuple('Parameters', 'vars fixed metric repeat file_in file_out experiment')
+try:
+    from md_perfmod.csv2store import is_store, load
+except ImportError:  # run as a script from the md_perfmod directory
+    from csv2store import is_store, load
+
+Parameters = namedtuple('Parameters', 'vars fixed metric repeat file_in file_out experiment chunksize')
+
+# Measurements grouped by point: sorted list of distinct points, the measurements of all points in the same order and
+# the offsets into the measurements where each point starts, followed by the total number of measurements
+Grouped = namedtuple('Grouped', 'points metrics offsets')
 
 
 def read_params():
@@ -18,7 +27,7 @@ def read_params():
                                                  ' to an input file for Extra-P',
                                      epilog='Example of use: python csv2extrap.py data.csv -v p q -f a=42 b=3.14')
 
-    parser.add_argument('file_in', help="Input file [csv]")
+    parser.add_argument('file_in', help="Input file [csv, parquet, feather]")
     parser.add_argument('file_out', nargs='?', default='',
                         help='Output file (will be overwritten) [default: FILE_IN with the file extension changed to '
                              '.txt]')
@@ -37,6 +46,11 @@ def read_params():
                              'for only p should be created, using the measurements when q was 3.')
     parser.add_argument('--single-measurement', action='store_true',
                         help='Use this flag if your data has no repeated measurements and therefore no repeat column')
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help='Read the input file in chunks of this many rows and keep only the rows matching the '
+                             'fixed values. Only the columns of the variables, metric, repeat count and fixed '
+                             'variables are read, so all other parameters should be fixed. Columnar stores are always '
+                             'read this way. [default: read the whole file at once]')
 
     args = parser.parse_args()
 
@@ -64,13 +78,52 @@ def read_params():
             key, val = entry.split("=", 1)
             fixed[key] = val
 
-    params = Parameters(variables, fixed, metric, repeat, file_in, file_out, exp_name)
+    params = Parameters(variables, fixed, metric, repeat, file_in, file_out, exp_name, args.chunksize)
 
     print(params)  # TODO: Nicer display
 
     return params
 
 
+def write_line(file, header, values, converter=str):
+    """
+    Write a line to the result file
+    :param file: Open output file
+    :param header: Line prefix
+    :param values: List of values to write
+    :param converter: Function to apply to every value before printing
+    """
+    file.write(header + ' ' + ' '.join(map(converter, values)) + '\n')
+
+
+def point_converter(p):
+    """
+    Converts a point to its string representation
+    :param p: Point
+    :return: String representation
+    """
+    if len(p) > 1:
+        return '( ' + ' '.join([str(f) for f in p]) + ' )'
+    else:
+        return str(p[0])
+
+
+def write_header(file, points, params):
+    """
+    Writes everything but the measurements in the extrap format.
+    :param file: Open output file
+    :param points: Sorted points
+    :param params: Parameters containing the variables, metric and experiment name
+    """
+    write_line(file, 'PARAMETER', params.vars)
+    write_line(file, 'POINTS', points, point_converter)
+    write_line(file, 'METRIC', [params.metric])
+    if len(params.vars) > 1:
+        write_line(file, 'EXPERIMENT', [params.experiment])
+    else:
+        write_line(file, 'REGION', [params.experiment])
+
+
 def write_extrap(mapping, params):
     """
     Writes a mapping to the output file in the extrap format.
@@ -78,56 +131,89 @@ def write_extrap(mapping, params):
     :param params: Parameters containing the output file and other settings
     """
     with open(params.file_out, 'w') as file:
-        def write(header, values, converter=str):
-            """
-            Write a line to the result file
-            :param header: Line prefix
-            :param values: List of values to write
-            :param converter: Function to apply to every value before printing
-            """
-            file.write(header + ' ' + ' '.join(map(converter, values)) + '\n')
-
-        def point_converter(p):
-            """
-            Converts a point to its string representation
-            :param p: Point
-            :return: String representation
-            """
-            if len(p) > 1:
-                return '( ' + ' '.join([str(f) for f in p]) + ' )'
-            else:
-                return str(p[0])
-
         # Sorting the points by each element
         points = sorted(mapping.keys())
 
         # Write extrap file format
-        write('PARAMETER', params.vars)
-        write('POINTS', points, point_converter)
-        write('METRIC', [params.metric])
-        if len(params.vars) > 1:
-            write('EXPERIMENT', [params.experiment])
-        else:
-            write('REGION', [params.experiment])
+        write_header(file, points, params)
         for point in points:
-            write('DATA', mapping[point])
+            write_line(file, 'DATA', mapping[point])
 
 
-def conversion(data, var, fixed, metric, repeat):
+def write_extrap_grouped(file, grouped, params):
     """
-    Converts the given data frame to a point to metric mapping.
-    :param data: Data frame to convert
+    Writes grouped measurements in the extrap format, streaming the measurements of each point directly.
+    :param file: Open output file
+    :param grouped: Grouped measurements
+    :param params: Parameters containing the variables, metric and experiment name
+    """
+    write_header(file, grouped.points, params)
+    metrics = grouped.metrics
+    for start, end in zip(grouped.offsets[:-1], grouped.offsets[1:]):
+        write_line(file, 'DATA', metrics[start:end])
+
+
+def fixed_mask(data, param, val):
+    """
+    Finds the rows where a column has the fixed value. Numbers are compared with a tolerance.
+    :param data: Data frame
+    :param param: Column to compare
+    :param val: Fixed value
+    :return: Boolean mask of the matching rows
+    """
+    try:
+        return np.isclose(data[param], float(val))
+    except ValueError:
+        return data[param] == val
+
+
+def read_selected(file_in, columns, fixed, chunksize):
+    """
+    Reads the columns of a CSV file in chunks or of a columnar store and keeps only the rows matching the fixed values.
+    :param file_in: CSV file or columnar store
+    :param columns: Columns to read in addition to the fixed columns
+    :param fixed: Dict of columns to keep fixed at a specific value
+    :param chunksize: Number of rows to read at once from CSV files
+    :return: Data frame containing the selected rows
+    """
+    use_columns = list(columns) + [f for f in fixed.keys() if f not in columns]
+    if is_store(file_in):
+        data = load(file_in, use_columns, fixed)
+        for param, val in fixed.items():
+            data = data[fixed_mask(data, param, val)]
+        return data
+
+    selected = []
+    for chunk in pd.read_csv(file_in, usecols=use_columns, chunksize=chunksize):
+        for param, val in fixed.items():
+            chunk = chunk[fixed_mask(chunk, param, val)]
+        selected.append(chunk)
+    if len(selected) == 0:
+        return pd.DataFrame(columns=use_columns)  # empty file
+    return pd.concat(selected)[use_columns]
+
+
+def select(data, var, fixed, metric, repeat, keys=()):
+    """
+    Selects the measurements used for creating models.
+    Rows are restricted to the fixed values. Of rows with the same keys, variables and repeat count only the first one
+    when sorting by all columns is kept, which fixes unused variables to their smallest value.
+    :param data: Data frame to select from
     :param var: List of variables to use as parameters
     :param fixed: Dict of unused variables to keep fixed at a specific value
     :param metric: The metric to use
     :param repeat: The column containing the repeat count
-    :return: Point to metric mapping
+    :param keys: Additional columns to distinguish measurements by, e.g. a compare column
+    :return: Data frame with the columns keys, var, metric sorted by keys, var and repeat count
     """
     # Parameter validation
     if repeat is not None and repeat not in data.columns:
         raise ValueError('Repeat column `%s` does not exist.' % repeat)
     if metric not in data.columns:
         raise ValueError('Metric column `%s` does not exist.' % metric)
+    for k in keys:
+        if k not in data.columns:
+            raise ValueError('Column `%s` does not exist.' % k)
     for v in var:
         if v not in data.columns:
             raise ValueError('Variable column `%s` does not exist.' % v)
@@ -136,51 +222,144 @@ def conversion(data, var, fixed, metric, repeat):
             raise ValueError('Variable column `%s` does not exist and therefore can not be fixed.' % f)
 
     # Select rows with fixed parameters
-    selected_data = data.sort_values(list(data.columns))
+    selected_data = data
     for param, val in fixed.items():
         if param in var:
             raise ValueError("Parameter `%s` can not be fixed, because it is used as a variable." % param)
-        try:
-            selected_data = selected_data[np.isclose(selected_data[param], float(val))]
-        except ValueError:
-            selected_data = selected_data[selected_data[param] == val]
+        selected_data = selected_data[fixed_mask(selected_data, param, val)]
         if len(selected_data) == 0:
             raise ValueError("Parameter `%s` can not be fixed to `%s`." % (param, val))
 
     # Create list of columns to use
-    columns_no_metrics = [] + var
-    columns_all = [] + var + [metric]
+    columns_no_metrics = list(keys) + var
+    columns_all = list(keys) + var + [metric]
     if repeat is not None:
         columns_no_metrics += [repeat]
-        columns_all += [repeat]
 
-    # Select columns containing variables, metric and repeat count
+    # Sort by the keys, parameters and the repeat count and then by all other columns, so the first of the
+    # duplicate entries is the same as when sorting by all columns
     # Drop duplicate entries
-    # Sort by the parameters and the repeat count
-    selected_data = selected_data[columns_all] \
-        .drop_duplicates(subset=columns_no_metrics) \
-        .sort_values(columns_no_metrics)
+    # Select columns containing keys, variables and metric
+    sort_columns = columns_no_metrics + [c for c in data.columns if c not in columns_no_metrics]
+    return selected_data \
+        .sort_values(sort_columns) \
+        .drop_duplicates(subset=columns_no_metrics)[columns_all]
+
+
+def group(selected_data, var, metric):
+    """
+    Groups selected measurements by their point.
+    :param selected_data: Data frame sorted by the variables as returned by select
+    :param var: List of variables to use as parameters
+    :param metric: The metric to use
+    :return: Grouped measurements
+    """
+    # One array of the variables and the metric, so both have the common type, e.g. integer points of float metrics
+    # are written as floats
+    values = selected_data[list(var) + [metric]].values
+    if len(values) == 0:
+        return Grouped([], [], [0])
+    points = values[:, :-1]
+    # A new point starts in every row that differs from the previous one in any variable
+    starts = np.flatnonzero(np.any(points[1:] != points[:-1], axis=1)) + 1
+    offsets = np.concatenate(([0], starts, [len(points)]))
+    return Grouped([tuple(p) for p in points[offsets[:-1]].tolist()],
+                   values[:, -1].tolist(),
+                   offsets.tolist())
+
+
+def to_mapping(grouped):
+    """
+    Converts grouped measurements to a point to metric mapping.
+    :param grouped: Grouped measurements
+    :return: Point to metric mapping
+    """
+    metrics = grouped.metrics
+    return dict((point, metrics[start:end])
+                for point, start, end in zip(grouped.points, grouped.offsets[:-1], grouped.offsets[1:]))
+
+
+def grouped_conversion(data, var, fixed, metric, repeat):
+    """
+    Converts the given data frame to measurements grouped by point.
+    :param data: Data frame to convert
+    :param var: List of variables to use as parameters
+    :param fixed: Dict of unused variables to keep fixed at a specific value
+    :param metric: The metric to use
+    :param repeat: The column containing the repeat count
+    :return: Grouped measurements
+    """
+    return group(select(data, var, fixed, metric, repeat), var, metric)
+
+
+def grouped_conversion_by(data, var, fixed, metric, repeat, compare):
+    """
+    Converts the given data frame to measurements grouped by point for each distinct value of the compare column.
+    Equivalent to calling grouped_conversion with the compare column fixed to each value, but sorts the data only once.
+    :param data: Data frame to convert
+    :param var: List of variables to use as parameters
+    :param fixed: Dict of unused variables to keep fixed at a specific value
+    :param metric: The metric to use
+    :param repeat: The column containing the repeat count
+    :param compare: The column to distinguish the measurements by
+    :return: Dict of compare value to grouped measurements
+    """
+    if compare in var or compare in fixed:
+        raise ValueError("Compare column `%s` can not be used as variable or be fixed." % compare)
+
+    selected_data = select(data, var, fixed, metric, repeat, keys=[compare])
+
+    return dict((key, group(frame, var, metric))
+                for key, frame in selected_data.groupby(compare, sort=False, observed=True))
+
+
+def conversion(data, var, fixed, metric, repeat):
+    """
+    Converts the given data frame to a point to metric mapping.
+    A point is a tuple of variable instances e.g. (2.0, 1.2) for variables (a, b).
+    The list of metrics consists of the repeated measurements.
+    :param data: Data frame to convert
+    :param var: List of variables to use as parameters
+    :param fixed: Dict of unused variables to keep fixed at a specific value
+    :param metric: The metric to use
+    :param repeat: The column containing the repeat count
+    :return: Point to metric mapping
+    """
+    return to_mapping(grouped_conversion(data, var, fixed, metric, repeat))
 
-    # Convert the selected data to a map of points to a list of metrics
-    # A point is a tuple of variable instances e.g. (2.0, 1.2) for variables (a, b)
-    # The list of metrics consists of the repeated measurements
-    mapping = {}
-    for row in selected_data.values:
-        point = tuple(row[:len(var)])  # the vars
-        if point not in mapping.keys():
-            mapping[point] = []
-        mapping[point].append(row[len(var)])  # the metric
 
-    return mapping
+def conversion_by(data, var, fixed, metric, repeat, compare):
+    """
+    Converts the given data frame to one point to metric mapping for each distinct value of the compare column.
+    :param data: Data frame to convert
+    :param var: List of variables to use as parameters
+    :param fixed: Dict of unused variables to keep fixed at a specific value
+    :param metric: The metric to use
+    :param repeat: The column containing the repeat count
+    :param compare: The column to distinguish the mappings by
+    :return: Dict of compare value to point to metric mapping
+    """
+    grouped = grouped_conversion_by(data, var, fixed, metric, repeat, compare)
+    return dict((key, to_mapping(g)) for key, g in grouped.items())
 
 
-def perform_conversion(params):
+def perform_conversion(params, data=None):
+    """
+    Converts the input file to an extrap input file.
+    :param params: Parameters of the conversion
+    :param data: Data frame with the content of the input file; the input file is read if no data frame is given
+    """
     # Read CSV into a data frame
-    data = pd.read_csv(params.file_in)
+    if data is None and (params.chunksize or is_store(params.file_in)):
+        columns = params.vars + [params.metric] + ([params.repeat] if params.repeat is not None else [])
+        data = read_selected(params.file_in, columns, params.fixed, params.chunksize)
+    elif data is None:
+        data = pd.read_csv(params.file_in)
 
-    mapping = conversion(data, params.vars, params.fixed, params.metric, params.repeat)
+    grouped = grouped_conversion(data, params.vars, params.fixed, params.metric, params.repeat)
 
-    write_extrap(mapping, params)
+    with open(params.file_out, 'w') as file:
+        write_extrap_grouped(file, grouped, params)
 
 
 def main():
@@ -4,9 +4,22 @@ from collections import namedtuple
 
 import pandas as pd
 
-from visualizer.model_creation import create
+try:
+    from md_perfmod.csv2extrap import read_selected
+    from md_perfmod.csv2store import is_store
+    from md_perfmod.visualizer import model_creation
+    from md_perfmod.visualizer.model_creation import collect, fit_cache, models_of, submit, MODELERS
+except ImportError:  # run as a script from the md_perfmod directory
+    from csv2extrap import read_selected
+    from csv2store import is_store
+    from visualizer import model_creation
+    from visualizer.model_creation import collect, fit_cache, models_of, submit, MODELERS
 
-Parameters = namedtuple('Parameters', 'vars fixed metric compare repeat file_in file_out')
+Parameters = namedtuple('Parameters', 'vars fixed metric compare repeat file_in file_out use_cache chunksize modeler '
+                                      'spec workers')
+
+# One set of models of a batch
+Job = namedtuple('Job', 'name vars fixed metric compare repeat')
 
 
 def read_params():
@@ -16,9 +29,11 @@ def read_params():
     """
 
     parser = argparse.ArgumentParser(description='Creates performance models from a CSV file using Extra-P',
-                                     epilog='Example of use: python csv2model.py data.csv -v p q -f a=42 b=3.14')
+                                     epilog='Example of use: python csv2model.py data.csv -v p q -f a=42 b=3.14\n'
+                                            '                python csv2model.py data.csv models.json -s spec.json',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
 
-    parser.add_argument('file_in', help="Input file [csv]")
+    parser.add_argument('file_in', help="Input file [csv, parquet, feather]")
     parser.add_argument('file_out', nargs='?', default='',
                         help='Output file containing the models in a JSON format (will be overwritten) [default: No '
                              'file is written')
@@ -26,8 +41,13 @@ def read_params():
                         help='Column containing the repeat count [default: %(default)s]')
     parser.add_argument('-m', '--metric', default='time',
                         help='Column containing the measurement values [default: %(default)s]')
-    parser.add_argument('-v', '--vars', required=True, nargs='+',
+    parser.add_argument('-v', '--vars', nargs='+',
                         help='Column names of the variables to use')
+    parser.add_argument('-s', '--spec', default=None,
+                        help='Batch specification file [json, yaml] listing the models to create, the data is read '
+                             'only once. Each job has a name, vars and optionally metric, fixed, compare and repeat, '
+                             'which default to the top level values of the file and then to the arguments.\n'
+                             'E.g. {"metric": "time", "jobs": [{"name": "p", "vars": ["p"], "fixed": {"q": 3}}]}')
     parser.add_argument('-c', '--compare', default=None,  # nargs='+', # TODO support multiple compare columns
                         help='Create a model for each distinct value in this column [default: %(default)s]')
     parser.add_argument('-f', '--fixed', nargs='+',
@@ -37,15 +57,36 @@ def read_params():
                              'for only p should be created, using the measurements when q was 3.')
     parser.add_argument('--single-measurement', action='store_true',
                         help='Use this flag if your data has no repeated measurements and therefore no repeat column')
+    parser.add_argument('--modeler', choices=MODELERS, default='extrap',
+                        help='Modeler to use; the native least squares modeler supports any number of variables '
+                             '[default: %(default)s]')
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help='Read the input file in chunks of this many rows and keep only the rows matching the '
+                             'fixed values. Only the columns of the variables, metric, repeat count, compare column '
+                             'and fixed variables are read, so all other parameters should be fixed. Columnar stores '
+                             'are always read this way. [default: read the whole file at once]')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='Number of processes fitting models concurrently [default: number of CPUs]')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always fit the models instead of reusing cached fits from %s' % fit_cache.directory)
+    parser.add_argument('--clear-cache', action='store_true',
+                        help='Remove all cached fits before creating the models')
 
     args = parser.parse_args()
 
+    if args.vars is None and args.spec is None:
+        parser.error('either --vars or --spec is required')
+
     variables = args.vars
     metric = args.metric
     compare = args.compare
     repeat = args.repeat
     file_in = args.file_in
     file_out = args.file_out
+    use_cache = not args.no_cache
+
+    if args.clear_cache:
+        fit_cache.clear()
 
     if args.single_measurement:
         repeat = None
@@ -57,34 +98,132 @@ def read_params():
             key, val = entry.split("=", 1)
             fixed[key] = val
 
-    params = Parameters(variables, fixed, metric, compare, repeat, file_in, file_out)
+    params = Parameters(variables, fixed, metric, compare, repeat, file_in, file_out, use_cache, args.chunksize,
+                        args.modeler, args.spec, args.workers)
 
     print(params)  # TODO: Nicer display
 
     return params
 
 
+def read_spec(file):
+    """
+    Reads a batch specification, either a list of jobs or a dictionary with the jobs and default values for them
+    :param file: JSON or YAML file, YAML requires PyYAML
+    :return: Dictionary with the jobs
+    """
+    with open(file) as f:
+        if file.endswith(('.yml', '.yaml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError('Reading YAML specifications requires PyYAML, use a JSON file or install pyyaml')
+            spec = yaml.safe_load(f)
+        else:
+            spec = json.load(f)
+
+    if isinstance(spec, list):
+        spec = {'jobs': spec}
+    return spec
+
+
+def batch_jobs(params):
+    """
+    Creates the jobs of a batch specification or a single job from the arguments
+    :param params: Named parameter tuple
+    :return: List of jobs
+    """
+    if params.spec is None:
+        return [Job(None, params.vars, params.fixed, params.metric, params.compare, params.repeat)]
+
+    spec = read_spec(params.spec)
+    jobs = []
+    for i, entry in enumerate(spec['jobs']):
+        def get(key, default):
+            return entry.get(key, spec.get(key, default))
+
+        name = entry.get('name', 'job%d' % i)
+        if 'vars' not in entry:
+            raise ValueError('Job `%s` of %s has no vars' % (name, params.spec))
+        fixed = dict(params.fixed)
+        fixed.update(spec.get('fixed', {}))
+        fixed.update(entry.get('fixed', {}))
+        variables = entry['vars'] if isinstance(entry['vars'], list) else [entry['vars']]
+        jobs.append(Job(name, variables, fixed, get('metric', params.metric), get('compare', params.compare),
+                        get('repeat', params.repeat)))
+
+    names = [job.name for job in jobs]
+    if len(set(names)) != len(names):
+        raise ValueError('Job names must be unique: %s' % names)
+    return jobs
+
+
+def read_data(params, jobs):
+    """
+    Reads the data of all jobs at once
+    :param params: Named parameter tuple
+    :param jobs: List of jobs
+    :return: Data frame
+    """
+    if not (params.chunksize or is_store(params.file_in)):
+        return pd.read_csv(params.file_in)
+
+    columns = []
+    for job in jobs:
+        for c in job.vars + [job.metric, job.repeat, job.compare] + list(job.fixed.keys()):
+            if c is not None and c not in columns:
+                columns.append(c)
+    # only the values fixed by all jobs can be selected while reading
+    common = dict((k, v) for k, v in jobs[0].fixed.items() if all(job.fixed.get(k) == v for job in jobs))
+    return read_selected(params.file_in, columns, common, params.chunksize)
+
+
+def create_all(data, jobs, use_cache=True, modeler='extrap'):
+    """
+    Creates the models of all jobs. The fits of all jobs are submitted at once and run concurrently in the worker pool.
+    :param data: Data frame
+    :param jobs: List of jobs
+    :param use_cache: Whether to reuse fits from the persistent fit cache
+    :param modeler: One of MODELERS
+    :return: List with the list of models of each job
+    """
+    tasks = []
+    for job in jobs:
+        compare_values = data[job.compare].unique() if job.compare is not None else []
+        tasks.append(submit(data, job.vars, job.metric, job.repeat, job.compare, compare_values, job.fixed, use_cache,
+                            modeler))
+    return [models_of(t, collect([future for _, future in t]), job.vars) for job, t in zip(jobs, tasks)]
+
+
 def main():
     params = read_params()
 
-    if params.compare is not None:
-        data = pd.read_csv(params.file_in)
-        compare_values = data[params.compare].unique()
-    else:
-        compare_values = []
+    if params.workers is not None:
+        model_creation.max_workers = params.workers
 
-    models = create(params.file_in, params.vars, params.metric, params.repeat,
-                    params.compare, compare_values, params.fixed)
+    jobs = batch_jobs(params)
+    data = read_data(params, jobs)
+    all_models = create_all(data, jobs, params.use_cache, params.modeler)
 
     print('Model creation completed!\n')
 
-    print('%-15s%-12s%-s' % ('Identifier', 'Adj.R^2', 'Model'))
-    for model in models:
-        print('%-15s%-12f%-s' % (model.name, model.adj_r2, model.model_str))
-
-    if params.file_out is not '':
+    for job, models in zip(jobs, all_models):
+        if job.name is not None:
+            print('%s (%s)' % (job.name, ', '.join(job.vars)))
+        print('%-15s%-12s%-s' % ('Identifier', 'Adj.R^2', 'Model'))
+        for model in models:
+            print('%-15s%-12f%-s' % (model.name, model.adj_r2, model.model_str))
+        print()
+
+    if params.file_out != '':
+        if params.spec is None:
+            output = list(map(lambda x: x.serializable(), all_models[0]))
+        else:
+            output = dict((job.name, list(map(lambda x: x.serializable(), models)))
+                          for job, models in zip(jobs, all_models))
         with open(params.file_out, 'w') as file:
-            json.dump(list(map(lambda x: x.serializable(), models)), file, indent=4)
+            # model names are the values of the compare column, which may be numpy scalars
+            json.dump(output, file, indent=4, default=lambda o: o.item())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,147 @@
+import argparse
+import os
+from collections import namedtuple
+
+import pandas as pd
+
+Parameters = namedtuple('Parameters', 'file_in file_out max_categories')
+
+# Supported columnar formats by file extension
+store_formats = {'.parquet': 'parquet', '.feather': 'feather'}
+
+
+def read_params():
+    """
+    Reads and processes the program arguments and returns them as a named tuple.
+    :return: Named parameter tuple
+    """
+
+    parser = argparse.ArgumentParser(description='Converts a CSV file containing performance measurements to a typed '
+                                                 'columnar file (Parquet or Feather) for faster loading',
+                                     epilog='Example of use: python csv2store.py data.csv data.parquet')
+
+    parser.add_argument('file_in', help="Input file [csv]")
+    parser.add_argument('file_out', nargs='?', default='',
+                        help='Output file (will be overwritten), the format is chosen by the file extension %s '
+                             '[default: FILE_IN with the file extension changed to .parquet]' % list(store_formats))
+    parser.add_argument('--max-categories', type=float, default=0.5,
+                        help='Text columns with at most this fraction of distinct values are stored as categories '
+                             '[default: %(default)s]')
+
+    args = parser.parse_args()
+
+    file_in = args.file_in
+    file_out = args.file_out
+
+    # If no output filename was given, just use the input file with a parquet extension
+    if file_out == '' or file_out.isspace():
+        path, ext = os.path.splitext(file_in)
+        file_out = path + '.parquet'
+
+    if not is_store(file_out):
+        raise ValueError('Unknown output format `%s`. Supported: %s' % (file_out, list(store_formats)))
+
+    params = Parameters(file_in, file_out, args.max_categories)
+
+    print(params)
+
+    return params
+
+
+def is_store(file):
+    """
+    Checks whether a file is a columnar store by its extension
+    :param file: File name
+    :return: True for stores, False for any other file e.g. CSV files
+    """
+    return isinstance(file, str) and os.path.splitext(file)[1].lower() in store_formats
+
+
+def fingerprint(file):
+    """
+    Identifies the version of a result file without reading it
+    :param file: File name
+    :return: String of the absolute path, size and modification time
+    """
+    stat = os.stat(file)
+    return '%s:%d:%d' % (os.path.abspath(file), stat.st_size, stat.st_mtime_ns)
+
+
+def encode(data, max_categories=0.5):
+    """
+    Converts text columns with few distinct values to categorical columns
+    :param data: Data frame
+    :param max_categories: Maximum fraction of distinct values of a categorical column
+    :return: Data frame with categorical columns
+    """
+    data = data.copy()
+    for column in data.columns:
+        if data[column].dtype == object and data[column].nunique() <= max_categories * len(data):
+            data[column] = data[column].astype('category')
+    return data
+
+
+def store(data, file_out):
+    """
+    Writes a data frame to a columnar store
+    :param data: Data frame
+    :param file_out: Output file with a supported extension
+    """
+    fmt = store_formats[os.path.splitext(file_out)[1].lower()]
+    if fmt == 'parquet':
+        data.to_parquet(file_out, index=False)
+    else:
+        data.reset_index(drop=True).to_feather(file_out)
+
+
+def fixed_filters(fixed):
+    """
+    Converts fixed values to filters that can be pushed down to the Parquet reader.
+    Numbers are matched with the same tolerance as numpy.isclose, so the rows still have to be filtered exactly.
+    :param fixed: Dict of columns to keep fixed at a specific value
+    :return: List of filter tuples
+    """
+    filters = []
+    for param, val in fixed.items():
+        try:
+            number = float(val)
+        except ValueError:
+            filters.append((param, '==', val))
+            continue
+        tolerance = 1e-08 + 1e-05 * abs(number)
+        filters += [(param, '>=', number - tolerance), (param, '<=', number + tolerance)]
+    return filters
+
+
+def load(file, columns=None, fixed=None):
+    """
+    Loads a CSV file or a columnar store.
+    For stores only the given columns are read and rows not matching the fixed values are skipped while reading where
+    the format allows it (Parquet). The result may still contain rows that do not exactly match the fixed values.
+    :param file: CSV file or store
+    :param columns: Columns to read [default: all columns]
+    :param fixed: Dict of columns to keep fixed at a specific value
+    :return: Data frame
+    """
+    if not is_store(file):
+        return pd.read_csv(file, usecols=columns)
+
+    fmt = store_formats[os.path.splitext(file)[1].lower()]
+    if fmt == 'parquet':
+        filters = fixed_filters(fixed) if fixed else None
+        return pd.read_parquet(file, columns=columns, filters=filters)
+
+    from pyarrow import feather
+    return feather.read_table(file, columns=columns, memory_map=True).to_pandas()
+
+
+def main():
+    params = read_params()
+
+    store(encode(pd.read_csv(params.file_in), params.max_categories), params.file_out)
+
+    print("Conversion completed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1 @@
-__all__ = ['model', 'comparison']
+__all__ = ['model', 'comparison', 'pmnf', 'integration']
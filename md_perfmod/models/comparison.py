@@ -1,7 +1,5 @@
 """Compare combined models with models of higher dimensions"""
 
-from itertools import product
-
 import numpy as np
 
 from .model import Model
@@ -17,13 +15,22 @@ def combine(model_a, model_b, combined_name=None):
     """
     new_model_str = "(%s)*(%s)" % (model_a.model_str, model_b.model_str)
     combined_vars = [] + model_a.variables + list(filter(lambda v: v not in model_a.variables, model_b.variables))
-    m = Model(new_model_str, combined_vars)
-    m.name = combined_name
-    return m
+    return Model(new_model_str, combined_vars, name=combined_name)
+
+
+def evaluate_models(list_of_models, points):
+    """
+    Evaluates every model at every point
+    :param list_of_models: Models with the same variables
+    :param points: Array of shape (N, d) with one row per point
+    :return: Array of shape (n_models, N)
+    """
+    points = np.asarray(points, dtype=float)
+    return np.array([m.evaluate_many(points) for m in list_of_models]).reshape((len(list_of_models), len(points)))
 
 
 def find_best(list_of_models, point, best=min):
-    evaluated = map(lambda x: x.evaluate(*point), list_of_models)
+    evaluated = evaluate_models(list_of_models, [point])[:, 0]
     return best(zip(list_of_models, evaluated), key=lambda x: x[1])
 
 
@@ -31,26 +38,64 @@ def distance_to_real_best(high_dim_models, combined_models, point, *, best=min,
     best_cm, _ = find_best(combined_models, point, best)
     matching_hdm = next(m for m in high_dim_models if m.name == best_cm.name)
     best_hdm, metric_best = find_best(high_dim_models, point, best)
-    if matching_hdm.name == best_hdm:
+    if matching_hdm is best_hdm:
         return 0
-    metric_matching = matching_hdm.evaluate(*point)
+    metric_matching = matching_hdm.evaluate_many([point])[0]
     return distance_norm(metric_best, metric_matching)
 
 
 def sample_points(bounds, n_samples):
-    return product(*list(map(lambda bound: np.linspace(bound[0], bound[1], n_samples), bounds)))
+    """
+    Equally distributed sample points in the given bounds
+    :param bounds: (low, high) tuples for each dimension
+    :param n_samples: Number of samples per dimension
+    :return: Array of shape (n_samples^d, d) ordered like the cartesian product of the dimensions
+    """
+    axes = list(map(lambda bound: np.linspace(bound[0], bound[1], n_samples), bounds))
+    return np.stack([g.ravel() for g in np.meshgrid(*axes, indexing='ij')], axis=1)
+
+
+_arg_best = {min: np.argmin, max: np.argmax}
+
+
+def classification_errors(high_dim_models, combined_models, points, *, best=min, distance_norm=lambda x, y: abs(x - y)):
+    """
+    Vectorized distance_to_real_best for many points
+    :param high_dim_models: Models of higher dimension
+    :param combined_models: Combined models with the same names as the high dimensional models
+    :param points: Array of shape (N, d)
+    :param best: min or max; selects which model is considered the best
+    :param distance_norm: Distance between two arrays of metric values
+    :return: Array of shape (N,) with the distance of the classification to the real best model per point
+    """
+    arg_best = _arg_best.get(best)
+    if arg_best is None:
+        raise ValueError('Best must be either min or max. Given: %s' % best)
+
+    hdm_index = dict((m.name, i) for i, m in enumerate(high_dim_models))
+    missing = [m.name for m in combined_models if m.name not in hdm_index]
+    if missing:
+        raise ValueError('No high dimensional model for the combined models %s' % missing)
+    matching = np.array([hdm_index[m.name] for m in combined_models])
+
+    hdm_values = evaluate_models(high_dim_models, points)
+    best_cm = arg_best(evaluate_models(combined_models, points), axis=0)
+    best_hdm = arg_best(hdm_values, axis=0)
+
+    columns = np.arange(hdm_values.shape[1])
+    matching_hdm = matching[best_cm]
+    distances = distance_norm(hdm_values[best_hdm, columns], hdm_values[matching_hdm, columns])
+    return np.where(matching_hdm == best_hdm, 0, distances)
 
 
 def calculate_error(high_dim_models, combined_models, *bounds, n_samples=53, best=min,
                     distance_norm=lambda x, y: abs(x - y), rel=False):
     x = sample_points(bounds, n_samples)
 
-    def distance_fun(p):
-        return distance_to_real_best(high_dim_models, combined_models, p, best=best, distance_norm=distance_norm)
-
-    errors = list(map(distance_fun, x))
+    errors = classification_errors(high_dim_models, combined_models, x, best=best, distance_norm=distance_norm)
+    correct = int(np.count_nonzero(errors == 0))
     if not rel:
-        return sum(errors), errors.count(0), min(errors), max(errors)
+        return float(errors.sum()), correct, float(errors.min()), float(errors.max())
     else:
-        n = (n_samples * n_samples)
-        return sum(errors) / n, errors.count(0) / n, min(errors), max(errors)
+        n = len(errors)
+        return float(errors.sum()) / n, correct / n, float(errors.min()), float(errors.max())
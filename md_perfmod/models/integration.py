@@ -0,0 +1,211 @@
+"""Integration of performance models
+
+Models in the performance model normal form (PMNF) are sums of terms c * prod_l x_l^a * log^n(x_l). Each factor of a
+term has the antiderivative
+
+    x^(a+1) * sum_{k=0}^{n} (-1)^k n! / (n-k)! * ln^(n-k)(x) / (a+1)^(k+1)     for a != -1
+    ln^(n+1)(x) / (n+1)                                                         for a == -1
+
+so these models are integrated in closed form. Other models are integrated with adaptive quadrature.
+"""
+
+import ast
+import math
+import sys
+from functools import lru_cache
+
+import numpy as np
+from scipy.integrate import nquad
+
+METHODS = ('auto', 'analytic', 'adaptive')
+
+# Default tolerances of the adaptive quadrature, the same as scipy.integrate.quad
+default_epsabs = 1.49e-8
+default_epsrel = 1.49e-8
+
+# Maximum number of terms when expanding products of sums
+max_terms = 1000
+
+# Logarithms as factors of the natural logarithm
+log_factors = {'log': 1.0, 'log2': 1 / math.log(2), 'log10': 1 / math.log(10)}
+constants = {'pi': math.pi, 'epsilon': np.finfo(float).eps}
+
+# Number literals are ast.Num before Python 3.8
+_number_node = ast.Constant if sys.version_info >= (3, 8) else ast.Num
+
+
+class NotClosedForm(ValueError):
+    pass
+
+
+def _multiply(terms_a, terms_b):
+    if len(terms_a) * len(terms_b) > max_terms:
+        raise NotClosedForm('Too many terms')
+    return [(ca * cb, tuple((a1 + a2, n1 + n2) for (a1, n1), (a2, n2) in zip(pa, pb)))
+            for ca, pa in terms_a for cb, pb in terms_b]
+
+
+def _constant(terms):
+    if any(any(f != (0, 0) for f in powers) for _, powers in terms):
+        raise NotClosedForm('Expression is not constant')
+    return sum(c for c, _ in terms)
+
+
+def _expand(node, variables):
+    """
+    Expands an expression into a sum of terms
+    :param node: ast node
+    :param variables: Variable names
+    :return: List of (coefficient, ((a, n) for each variable)) tuples for c * prod x^a * ln^n(x)
+    """
+    one = ((0, 0),) * len(variables)
+    if isinstance(node, ast.Expression):
+        return _expand(node.body, variables)
+    if isinstance(node, _number_node):
+        value = node.value if sys.version_info >= (3, 8) else node.n
+        if isinstance(value, (int, float)):
+            return [(float(value), one)]
+    if isinstance(node, ast.Name):
+        if node.id in variables:
+            ix = variables.index(node.id)
+            return [(1.0, one[:ix] + ((1, 0),) + one[ix + 1:])]
+        if node.id in constants:
+            return [(constants[node.id], one)]
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+        sign = -1 if isinstance(node.op, ast.USub) else 1
+        return [(sign * c, p) for c, p in _expand(node.operand, variables)]
+    if isinstance(node, ast.BinOp):
+        left = _expand(node.left, variables)
+        if isinstance(node.op, ast.Pow):
+            exponent = _constant(_expand(node.right, variables))
+            if len(left) == 1:
+                c, powers = left[0]
+                if c < 0 and exponent != int(exponent):
+                    raise NotClosedForm('Fractional power of a negative number')
+                return [(c ** exponent, tuple((a * exponent, n * exponent) for a, n in powers))]
+            if exponent != int(exponent) or exponent < 0:
+                raise NotClosedForm('Power of a sum')
+            result = [(1.0, one)]
+            for _ in range(int(exponent)):
+                result = _multiply(result, left)
+            return result
+        right = _expand(node.right, variables)
+        if isinstance(node.op, ast.Add):
+            return left + right
+        if isinstance(node.op, ast.Sub):
+            return left + [(-c, p) for c, p in right]
+        if isinstance(node.op, ast.Mult):
+            return _multiply(left, right)
+        if isinstance(node.op, ast.Div) and len(right) == 1 and all(n == 0 for _, n in right[0][1]):
+            c, powers = right[0]
+            return _multiply(left, [(1 / c, tuple((-a, 0) for a, _ in powers))])
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and len(node.args) == 1 \
+            and not node.keywords:
+        name = node.func.id
+        if name in log_factors and isinstance(node.args[0], ast.Name) and node.args[0].id in variables:
+            ix = variables.index(node.args[0].id)
+            return [(log_factors[name], one[:ix] + ((0, 1),) + one[ix + 1:])]
+        if name == 'sqrt':
+            return _expand(ast.BinOp(node.args[0], ast.Pow(), _number_node(0.5)), variables)
+    raise NotClosedForm('Unsupported expression `%s`' % type(node).__name__)
+
+
+@lru_cache(maxsize=4096)
+def pmnf_terms(expression, variables):
+    """
+    Expands a model expression into PMNF terms
+    :param expression: Model string representation as returned by notation_fix
+    :param variables: Tuple of variable names
+    :return: List of (coefficient, ((a, n) for each variable)) tuples or None if the expression is not in PMNF
+    """
+    try:
+        terms = _expand(ast.parse(expression.replace('^', '**'), mode='eval'), list(variables))
+    except (SyntaxError, NotClosedForm, ZeroDivisionError, OverflowError):
+        return None
+    if any(n != int(n) or n < 0 for _, powers in terms for _, n in powers):
+        return None  # only integer powers of logarithms have a closed form
+    return [(c, tuple((a, int(n)) for a, n in powers)) for c, powers in terms]
+
+
+def antiderivative(x, a, n):
+    """
+    Evaluates the antiderivative of x^a * ln^n(x)
+    :param x: Position > 0
+    :param a: Exponent of x
+    :param n: Non-negative integer exponent of the logarithm
+    :return: Value of the antiderivative
+    """
+    if a == -1:
+        return math.log(x) ** (n + 1) / (n + 1)
+    log = math.log(x)
+    return x ** (a + 1) * sum((-1) ** k * math.factorial(n) / math.factorial(n - k) * log ** (n - k)
+                              / (a + 1) ** (k + 1) for k in range(n + 1))
+
+
+def integrate_factor(a, n, low, high):
+    """
+    Integrates x^a * ln^n(x) from low to high
+    :param a: Exponent of x
+    :param n: Non-negative integer exponent of the logarithm
+    :param low: Lower bound
+    :param high: Upper bound
+    :return: Value of the integral
+    """
+    if n == 0 and a == int(a) and a >= 0:
+        return (high ** (a + 1) - low ** (a + 1)) / (a + 1)  # polynomials are defined for negative values as well
+    if low > high:
+        return -integrate_factor(a, n, high, low)
+    if low < 0:
+        raise NotClosedForm('Term x^%r * log^%d(x) is not defined for negative values' % (a, n))
+    if low == 0:
+        if a <= -1:
+            raise NotClosedForm('Integral of x^%r * log^%d(x) diverges at 0' % (a, n))
+        return antiderivative(high, a, n) if high > 0 else 0.0  # the antiderivative goes to 0 at 0
+    return antiderivative(high, a, n) - antiderivative(low, a, n)
+
+
+def integrate_terms(terms, bounds):
+    """
+    Integrates a sum of PMNF terms
+    :param terms: Terms as returned by pmnf_terms
+    :param bounds: (low, high) tuples defining the integration bounds for each variable
+    :return: Value of the integral, estimate of the rounding error
+    """
+    contributions = []
+    for c, powers in terms:
+        value = c
+        for (a, n), (low, high) in zip(powers, bounds):
+            value *= integrate_factor(a, n, low, high)
+        contributions.append(value)
+    value = math.fsum(contributions)
+    error = 4 * float(np.finfo(float).eps) * len(contributions) * max(map(abs, contributions), default=0.0)
+    return value, error
+
+
+def integrate(model, bounds, epsabs=default_epsabs, epsrel=default_epsrel, method='auto'):
+    """
+    Integrates a model in closed form if it is in PMNF, otherwise with adaptive quadrature
+    :param model: Model
+    :param bounds: (low, high) tuples defining the integration bounds for each variable of the model
+    :param epsabs: Absolute error tolerance of the adaptive quadrature
+    :param epsrel: Relative error tolerance of the adaptive quadrature
+    :param method: One of METHODS; 'analytic' raises NotClosedForm if there is no closed form
+    :return: Value of the integral, estimate of the absolute error
+    """
+    if method not in METHODS:
+        raise ValueError('Unknown method `%s`. Available: %s' % (method, METHODS))
+    if len(bounds) != len(model.variables):
+        raise ValueError('Must provide bounds for each variable %s. Given: %s' % (model.variables, bounds))
+
+    if method != 'adaptive':
+        terms = pmnf_terms(model.model_str, tuple(model.variables))
+        try:
+            if terms is None:
+                raise NotClosedForm('Model `%s` is not in PMNF' % model.model_str)
+            return integrate_terms(terms, bounds)
+        except (NotClosedForm, OverflowError, ValueError):
+            if method == 'analytic':
+                raise
+
+    value, error = nquad(model.evaluate, [tuple(b) for b in bounds], opts={'epsabs': epsabs, 'epsrel': epsrel})
+    return value, error
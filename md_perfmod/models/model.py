@@ -1,12 +1,17 @@
 """Class for evaluating an extrap performance model"""
 
-from itertools import product
+import ast
+import sys
+import threading
+from functools import lru_cache
 
 import cexprtk
 import numpy as np
 import re
 from scipy.integrate import simps
 
+from . import integration
+
 # 1. group: function, 2. group exponent, 4. group argument
 #  matches word^float(any) e.g. log2^2(2*x)
 fix_regex = re.compile(r'(\w+)\^([-+]?\d*\.?\d+([eE][-+]?\d+)?)(\([^(]*?\))')
@@ -31,23 +36,238 @@ def notation_fix(expression):
     return fix_regex.sub(r'(\1\4)^\2', tmp)  # replacement with (word(any))^float
 
 
+# Evaluation backends: 'numpy' evaluates whole arrays at once, 'cexprtk' evaluates point by point
+BACKENDS = ('numpy', 'cexprtk')
+default_backend = 'numpy'
+
+# Number of compiled expressions kept by compile_model
+compile_cache_size = 4096
+
+# Functions and constants the numpy backend understands; everything else falls back to cexprtk
+numpy_functions = {
+    'log2': np.log2,
+    'log10': np.log10,
+    'log': np.log,
+    'exp': np.exp,
+    'sqrt': np.sqrt,
+    'abs': np.abs,
+}
+numpy_constants = {
+    'pi': np.pi,
+    'epsilon': np.finfo(float).eps,
+    'inf': np.inf,
+}
+
+# Number literals are ast.Num before Python 3.8
+_number_node = ast.Constant if sys.version_info >= (3, 8) else ast.Num
+
+_numpy_nodes = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Call, ast.Name, ast.Load, _number_node,
+                ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.USub, ast.UAdd)
+
+
+def set_default_backend(backend):
+    """
+    Sets the evaluation backend used by models that do not specify one
+    :param backend: One of BACKENDS
+    """
+    global default_backend
+    if backend not in BACKENDS:
+        raise ValueError('Unknown backend `%s`. Available: %s' % (backend, BACKENDS))
+    default_backend = backend
+
+
+class NumpyExpression:
+    def __init__(self, expression, variables):
+        """
+        Compiles a fixed model expression into a function evaluating it on numpy arrays.
+        Only arithmetic, powers, the functions in `numpy_functions` and the constants in `numpy_constants` are
+        supported.
+        :param expression: Model string representation as returned by notation_fix
+        :param variables: Variable names in the order the arguments are passed when calling the expression
+        """
+        tree = ast.parse(expression.replace('^', '**'), mode='eval')
+        for node in ast.walk(tree):
+            if not isinstance(node, _numpy_nodes):
+                raise ValueError('Unsupported syntax `%s` in expression `%s`' % (type(node).__name__, expression))
+            if isinstance(node, ast.Call) and (not isinstance(node.func, ast.Name)
+                                               or node.func.id not in numpy_functions
+                                               or len(node.args) != 1 or node.keywords):
+                raise ValueError('Unsupported function call in expression `%s`' % expression)
+            if isinstance(node, ast.Name) and node.id not in variables and node.id not in numpy_functions \
+                    and node.id not in numpy_constants:
+                raise ValueError('Unknown symbol `%s` in expression `%s`' % (node.id, expression))
+        self.expression = expression
+        self.variables = list(variables)
+        self.code = compile(tree, '<model>', 'eval')
+
+    def __reduce__(self):
+        # code objects can not be pickled, compile again when unpickling
+        return NumpyExpression, (self.expression, self.variables)
+
+    def __call__(self, *arrays):
+        """
+        Evaluates the expression
+        :param arrays: One array (or scalar) per variable
+        :return: Result broadcast to the shape of the arguments
+        """
+        arrays = [np.asarray(a, dtype=float) for a in arrays]
+        values = dict(numpy_functions)
+        values.update(numpy_constants)
+        values.update(zip(self.variables, arrays))
+        with np.errstate(all='ignore'):
+            result = eval(self.code, {'__builtins__': {}}, values)
+        # constant terms do not depend on the input, but the result must have the shape of the input
+        return np.broadcast_to(result, np.broadcast(*arrays).shape if arrays else ()).astype(float)
+
+
+class CexprtkExpression:
+    def __init__(self, expression, variables):
+        """
+        Compiles a fixed model expression with cexprtk.
+        Each thread evaluates its own copy of the expression, so calls are re-entrant.
+        :param expression: Model string representation as returned by notation_fix
+        :param variables: Variable names in the order the arguments are passed when calling the expression
+        """
+        self.expression = expression
+        self.variables = list(variables)
+        self.local = threading.local()
+        self._compile()  # fail early on invalid expressions
+
+    def __reduce__(self):
+        # cexprtk objects can not be pickled, compile again when unpickling
+        return CexprtkExpression, (self.expression, self.variables)
+
+    def _compile(self):
+        var_dict = dict(map(lambda x: (x, 0), self.variables))  # dict of variables with default value 0
+        symbols = cexprtk.Symbol_Table(var_dict, add_constants=True)
+        self.local.symbols = symbols
+        self.local.compiled = cexprtk.Expression(self.expression, symbols)
+
+    def __call__(self, *values):
+        """
+        Evaluates the expression at a single position
+        :param values: One value per variable
+        :return: Result
+        """
+        if not hasattr(self.local, 'compiled'):
+            self._compile()
+        # assign values to variables of this thread's symbol table; note that the dictionary is ordered
+        variables = self.local.symbols.variables
+        for k, v in zip(self.variables, values):
+            variables[k] = v
+        return self.local.compiled()
+
+
+class CompiledModel:
+    def __init__(self, model_str, variables, backend):
+        """
+        Model expression prepared for evaluation, shared by all models with the same expression
+        :param model_str: Expression as string
+        :param variables: Variable names
+        :param backend: Evaluation backend (one of BACKENDS)
+        """
+        if backend not in BACKENDS:
+            raise ValueError('Unknown backend `%s`. Available: %s' % (backend, BACKENDS))
+        self.model_str = notation_fix(model_str)
+        self.variables = tuple(variables)
+        self.backend = backend
+        self.vectorized = None
+        self._scalar = None
+        if backend == 'numpy':
+            try:
+                self.vectorized = NumpyExpression(self.model_str, variables)
+            except (SyntaxError, ValueError):
+                self.backend = 'cexprtk'  # expression uses features only cexprtk understands
+        if self.backend == 'cexprtk':
+            self._scalar = CexprtkExpression(self.model_str, variables)
+
+    @property
+    def scalar(self):
+        """
+        The expression compiled with cexprtk, compiled on first use for the numpy backend
+        :return: CexprtkExpression
+        """
+        if self._scalar is None:
+            self._scalar = CexprtkExpression(self.model_str, self.variables)
+        return self._scalar
+
+
+@lru_cache(maxsize=compile_cache_size)
+def compile_model(model_str, variables, backend):
+    """
+    Compiles a model expression, reusing previously compiled expressions
+    :param model_str: Expression as string
+    :param variables: Tuple of variable names
+    :param backend: Evaluation backend (one of BACKENDS)
+    :return: CompiledModel
+    """
+    return CompiledModel(model_str, variables, backend)
+
+
 class Model:
-    def __init__(self, model_str, variables, name=None, adj_r2=None):
+    def __init__(self, model_str, variables, name=None, adj_r2=None, backend=None):
         """
-        Parses a model expression and prepares it for evaluation
+        Model of an expression. The expression is compiled on first use.
+        Models with the same expression and variables share the compiled expression.
         :param model_str: Expression as string
         :param variables: Variable names that will be replaced with values when evaluating the model
         :param name: Name of the model
         :param adj_r2: Adjusted r^2 for the model
+        :param backend: Evaluation backend (one of BACKENDS) [default: default_backend]
         """
-        self.name = name
-        self.adj_r2 = adj_r2
-        self.model_str = notation_fix(model_str)
-        self.variables = variables
-        var_dict = dict(map(lambda x: (x, 0), variables))  # dict of variables with default value 0
+        backend = default_backend if backend is None else backend
+        if backend not in BACKENDS:
+            raise ValueError('Unknown backend `%s`. Available: %s' % (backend, BACKENDS))
+        self._model_str = model_str
+        self._variables = tuple(variables)
+        self._name = name
+        self._adj_r2 = adj_r2
+        self._backend = backend
+        self._compiled = None
 
-        self.symbols = cexprtk.Symbol_Table(var_dict, add_constants=True)
-        self.expression = cexprtk.Expression(self.model_str, self.symbols)
+    def __reduce__(self):
+        # only the expression is stored, it is compiled again on first use after unpickling
+        return Model, (self._model_str, self._variables, self._name, self._adj_r2, self._backend)
+
+    @classmethod
+    def from_serializable(cls, data, backend=None):
+        """
+        Creates a model from the output of serializable
+        :param data: Dictionary as returned by serializable
+        :param backend: Evaluation backend (one of BACKENDS) [default: default_backend]
+        :return: Model
+        """
+        return cls(data['model'], data['variables'], name=data['identifier'], adj_r2=data['adj_r2'],
+                   backend=backend)
+
+    @property
+    def compiled(self):
+        """
+        :return: CompiledModel of the expression, compiled on first access
+        """
+        if self._compiled is None:
+            self._compiled = compile_model(self._model_str, self._variables, self._backend)
+        return self._compiled
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def adj_r2(self):
+        return self._adj_r2
+
+    @property
+    def model_str(self):
+        return self.compiled.model_str
+
+    @property
+    def variables(self):
+        return list(self._variables)
+
+    @property
+    def backend(self):
+        return self.compiled.backend
 
     def __str__(self):
         return self.model_str
@@ -64,12 +284,27 @@ class Model:
         :param values: Values for the variables of the model in the same order as the variable names
         :return:
         """
-        if len(values) != len(self.variables):
+        compiled = self.compiled
+        if len(values) != len(compiled.variables):
             raise ValueError('Must provide a value for each variable %s. Given: %s' % (self.variables, values))
-        # assign values to variables; note that the dictionary is ordered
-        for k, v in zip(self.variables, values):
-            self.symbols.variables[k] = v
-        return self.expression()
+        if compiled.vectorized is not None:
+            return float(compiled.vectorized(*values))
+        return compiled.scalar(*values)
+
+    def evaluate_many(self, points):
+        """
+        Evaluate the model at many positions at once
+        :param points: Array of shape (N, d) with one row per position and one column per variable of the model
+        :return: Array of shape (N,) with the model values
+        """
+        compiled = self.compiled
+        points = np.asarray(points, dtype=float)
+        if points.ndim != 2 or points.shape[1] != len(compiled.variables):
+            raise ValueError('Points must have the shape (N, %d) for the variables %s. Given: %s'
+                             % (len(compiled.variables), self.variables, points.shape))
+        if compiled.vectorized is not None:
+            return compiled.vectorized(*points.T)
+        return np.fromiter((compiled.scalar(*p) for p in points), dtype=float, count=len(points))
 
     def integrate(self, *bounds, n_evaluations=100):
         """
@@ -85,6 +320,18 @@ class Model:
 
         return result
 
+    def quad(self, *bounds, epsabs=integration.default_epsabs, epsrel=integration.default_epsrel, method='auto'):
+        """
+        Integrate the model in the given bounds, in closed form for models in PMNF and with adaptive quadrature
+        otherwise
+        :param bounds: (low, high) tuples defining the integration bounds for each dimension
+        :param epsabs: Absolute error tolerance of the adaptive quadrature
+        :param epsrel: Relative error tolerance of the adaptive quadrature
+        :param method: One of integration.METHODS
+        :return: Area below the model curve, estimate of the absolute error
+        """
+        return integration.integrate(self, bounds, epsabs=epsabs, epsrel=epsrel, method=method)
+
     def sample(self, *bounds, n_evaluations=50):
         """
         Generate equally distributed samples of the model on the given domain
@@ -94,6 +341,6 @@ class Model:
         """
         dimensions = len(bounds)
         x = list(map(lambda bound: np.linspace(bound[0], bound[1], n_evaluations), bounds))
-        cart = product(*x)
-        samples = list(map(lambda c: self.evaluate(*c), cart))
-        return x, np.array(samples).reshape((n_evaluations,) * dimensions)
+        # 'ij' indexing orders the points like the cartesian product of the axes
+        grid = np.stack([g.ravel() for g in np.meshgrid(*x, indexing='ij')], axis=1)
+        return x, self.evaluate_many(grid).reshape((n_evaluations,) * dimensions)
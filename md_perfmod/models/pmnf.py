@@ -0,0 +1,284 @@
+"""Least-squares modeler searching the performance model normal form (PMNF)
+
+A hypothesis is c_0 + sum_k c_k * prod_{l in P_k} x_l^i * log2^j(x_l) where P_1, P_2, ... is a partition of a subset of
+the parameters. For one parameter this is c_0 + c_1 * x^i * log2^j(x), for two parameters additionally
+c_0 + c_1 * f(x) + c_2 * g(y) and c_0 + c_1 * f(x) * g(y). All hypotheses of the same structure are fitted at once.
+
+With more than two parameters the full search space is too large. Instead the best single parameter terms of each
+parameter are determined first and only combinations of those are searched.
+"""
+
+from collections import namedtuple
+from itertools import combinations, product
+
+import numpy as np
+
+from .model import Model
+
+# Exponents of the polynomial and the logarithmic part of a term, as used by Extra-P
+poly_exponents = (0, 1 / 4, 1 / 3, 1 / 2, 2 / 3, 3 / 4, 1, 5 / 4, 4 / 3, 3 / 2, 5 / 3, 7 / 4, 2, 9 / 4, 7 / 3, 5 / 2,
+                  8 / 3, 11 / 4, 3)
+log_exponents = (0, 1, 2)
+
+# Maximum number of hypotheses fitted at once; bounds the memory used for the design matrices
+chunk_size = 20000
+
+# Number of best single parameter terms per parameter combined when searching models of more than two parameters
+top_terms = 5
+
+# Exponents (i, j) of x^i * log2^j(x) for every candidate term of one parameter
+Terms = namedtuple('Terms', 'exponents values')
+
+# Best hypothesis: adjusted r^2, groups of parameter indices, exponents per parameter, coefficients
+Fit = namedtuple('Fit', 'adj_r2 groups exponents coefficients')
+
+
+def candidate_terms(x, poly=poly_exponents, log=log_exponents):
+    """
+    Evaluates all candidate terms of a parameter
+    :param x: Values of the parameter at the measurement points
+    :param poly: Polynomial exponents
+    :param log: Logarithm exponents
+    :return: Terms with the exponent pairs and an array of shape (n_terms, n_points) with the term values
+    """
+    x = np.asarray(x, dtype=float)
+    if np.any(x <= 0):
+        log = (0,)  # logarithms are only defined for positive values
+    exponents = [(i, j) for i, j in product(poly, log) if (i, j) != (0, 0)]
+    return Terms(exponents, evaluate_terms(x, exponents))
+
+
+def evaluate_terms(x, exponents):
+    """
+    Evaluates terms x^i * log2^j(x)
+    :param x: Values of the parameter
+    :param exponents: List of exponent pairs (i, j)
+    :return: Array of shape (n_terms, n_values)
+    """
+    x = np.asarray(x, dtype=float)
+    with np.errstate(all='ignore'):
+        log2 = np.log2(x)
+        return np.array([x ** i * log2 ** j for i, j in exponents]).reshape((len(exponents), len(x)))
+
+
+def partitions(items):
+    """
+    Generates all set partitions of a list
+    :param items: List of items
+    :return: Generator of partitions, each a list of tuples
+    """
+    if len(items) == 0:
+        yield []
+        return
+    first, rest = items[0], items[1:]
+    for partition in partitions(rest):
+        yield [(first,)] + partition
+        for k in range(len(partition)):
+            yield partition[:k] + [(first,) + partition[k]] + partition[k + 1:]
+
+
+def structures(n_params):
+    """
+    Generates the structures of all hypotheses ordered by their number of terms
+    :param n_params: Number of parameters
+    :return: List of structures, each a list of groups of parameter indices forming one product term
+    """
+    result = [[]]
+    for size in range(1, n_params + 1):
+        for subset in combinations(range(n_params), size):
+            result += list(partitions(list(subset)))
+    return sorted(result, key=len)
+
+
+def adjusted_r2(ssr, sst, n, k):
+    """
+    Adjusted coefficient of determination
+    :param ssr: Residual sums of squares
+    :param sst: Total sum of squares
+    :param n: Number of points
+    :param k: Number of terms without the constant
+    :return: Adjusted r^2; -inf if there are not enough points for the number of terms
+    """
+    if n - k - 1 <= 0:
+        return np.full_like(ssr, -np.inf)
+    if sst == 0:
+        return np.where(ssr == 0, 1.0, -np.inf)
+    return 1 - (ssr / sst) * (n - 1) / (n - k - 1)
+
+
+def fit_batch(design, y):
+    """
+    Least squares fit of many hypotheses at once
+    :param design: Array of shape (n_hypotheses, n_points, n_coefficients)
+    :param y: Measured values of shape (n_points,)
+    :return: Coefficients of shape (n_hypotheses, n_coefficients), residual sums of squares of shape (n_hypotheses,)
+    """
+    # scale the columns for a better conditioned system
+    scale = np.abs(design).max(axis=1, keepdims=True)
+    scale[scale == 0] = 1
+    scaled = design / scale
+    normal = np.einsum('hnk,hnl->hkl', scaled, scaled)
+    coefficients = np.einsum('hkl,hl->hk', np.linalg.pinv(normal), np.einsum('hnk,n->hk', scaled, y))
+    residuals = y - np.einsum('hnk,hk->hn', scaled, coefficients)
+    return coefficients / scale[:, 0, :], np.einsum('hn,hn->h', residuals, residuals)
+
+
+def search(terms, y, structure_list, params=None):
+    """
+    Fits all hypotheses of the given structures and returns the best one
+    :param terms: Candidate terms per parameter
+    :param y: Measured values
+    :param structure_list: Structures to search
+    :param params: Index arrays restricting the candidate terms per parameter [default: all terms]
+    :return: Best Fit
+    """
+    n = len(y)
+    sst = float(np.sum((y - y.mean()) ** 2))
+    best = Fit(adjusted_r2(np.array([sst]), sst, n, 0)[0], [], {}, np.array([y.mean()]))
+
+    for groups in structure_list:
+        if len(groups) == 0:
+            continue
+        used = sorted(p for group in groups for p in group)
+        choices = [np.arange(len(terms[p].exponents)) if params is None else np.asarray(params[p]) for p in used]
+        combos = np.stack([c.ravel() for c in np.meshgrid(*choices, indexing='ij')], axis=1)
+        for start in range(0, len(combos), chunk_size):
+            chunk = combos[start:start + chunk_size]
+            columns = [np.ones((len(chunk), n))]
+            for group in groups:
+                column = np.ones((len(chunk), n))
+                for p in group:
+                    column = column * terms[p].values[chunk[:, used.index(p)]]
+                columns.append(column)
+            design = np.stack(columns, axis=-1)
+            valid = np.all(np.isfinite(design), axis=(1, 2))
+            if not np.any(valid):
+                continue
+            coefficients, ssr = fit_batch(design[valid], y)
+            adj = adjusted_r2(ssr, sst, n, len(groups))
+            ix = int(np.argmax(adj))
+            if adj[ix] > best.adj_r2:
+                combo = chunk[valid][ix]
+                exponents = dict((p, terms[p].exponents[combo[used.index(p)]]) for p in used)
+                best = Fit(float(adj[ix]), groups, exponents, coefficients[ix])
+    return best
+
+
+def parameter_slice(points, y, p):
+    """
+    Selects the measurements showing the influence of a single parameter. These are the points where all other
+    parameters have their smallest value, or if there are too few of them, the mean over all other parameters.
+    :param points: Array of shape (n_points, n_params)
+    :param y: Measured values
+    :param p: Index of the parameter
+    :return: Values of the parameter, measured values
+    """
+    others = [q for q in range(points.shape[1]) if q != p]
+    mask = np.all(points[:, others] == points[:, others].min(axis=0), axis=1)
+    if len(np.unique(points[mask, p])) >= 3:
+        return points[mask, p], y[mask]
+    x, inverse = np.unique(points[:, p], return_inverse=True)
+    return x, np.bincount(inverse, y) / np.bincount(inverse)
+
+
+def best_terms(terms, points, y, p, k):
+    """
+    Finds the candidate terms of a parameter best describing the measurements on its own
+    :param terms: Candidate terms of the parameter
+    :param points: Array of shape (n_points, n_params)
+    :param y: Measured values
+    :param p: Index of the parameter
+    :param k: Number of terms to select
+    :return: Indices of the k best candidate terms
+    """
+    x, y_slice = parameter_slice(points, y, p)
+    values = evaluate_terms(x, terms.exponents)
+    design = np.stack([np.ones_like(values), values], axis=-1)
+    adj = np.full(len(values), -np.inf)
+    valid = np.all(np.isfinite(design), axis=(1, 2))
+    if np.any(valid):
+        _, ssr = fit_batch(design[valid], y_slice)
+        adj[valid] = adjusted_r2(ssr, float(np.sum((y_slice - y_slice.mean()) ** 2)), len(y_slice), 1)
+    return np.argsort(-adj, kind='stable')[:k]
+
+
+def search_parallel(terms, y, structure_list, params, executor):
+    """
+    Searches the structures in parallel, one task per structure
+    :param terms: Candidate terms per parameter
+    :param y: Measured values
+    :param structure_list: Structures to search
+    :param params: Index arrays restricting the candidate terms per parameter
+    :param executor: concurrent.futures executor
+    :return: Best Fit
+    """
+    futures = [executor.submit(search, terms, y, [groups], params) for groups in structure_list]
+    best = None
+    try:
+        for future in futures:  # in the order of the structures, so ties are resolved like in search
+            result = future.result()
+            if best is None or result.adj_r2 > best.adj_r2:
+                best = result
+    except BaseException:
+        for future in futures:  # the search failed, the remaining structures are not needed
+            future.cancel()
+        raise
+    return best
+
+
+def term_str(variable, exponents):
+    """
+    String representation of x^i * log2^j(x)
+    :param variable: Variable name
+    :param exponents: (i, j)
+    :return: String in the Extra-P notation
+    """
+    i, j = exponents
+    factors = []
+    if i != 0:
+        factors.append(variable if i == 1 else '%s^%r' % (variable, i))
+    if j != 0:
+        factors.append('log2(%s)' % variable if j == 1 else 'log2^%d(%s)' % (j, variable))
+    return ' * '.join(factors)
+
+
+def to_model_str(best, variables):
+    """
+    Converts a fit to a model string
+    :param best: Fit
+    :param variables: Variable names
+    :return: Model string in the Extra-P notation
+    """
+    parts = [repr(float(best.coefficients[0]))]
+    for coefficient, group in zip(best.coefficients[1:], best.groups):
+        factors = [term_str(variables[p], best.exponents[p]) for p in group]
+        parts.append(' * '.join([repr(float(coefficient))] + factors))
+    return ' + '.join(parts)
+
+
+def fit(points, values, variables, name=None, k=None, executor=None):
+    """
+    Creates a model by searching the PMNF hypotheses and selecting the one with the best adjusted r^2.
+    Up to two variables all hypotheses are searched, for more only combinations of the best single parameter terms.
+    :param points: Array of shape (n_points, n_variables)
+    :param values: Measured value (e.g. the mean of the repetitions) at each point
+    :param variables: Variable names
+    :param name: Name of the model
+    :param k: Number of best single parameter terms combined for more than two variables [default: top_terms]
+    :param executor: concurrent.futures executor to search the hypotheses in parallel [default: search sequentially]
+    :return: Model
+    """
+    points = np.asarray(points, dtype=float).reshape((len(values), len(variables)))
+    y = np.asarray(values, dtype=float)
+    terms = [candidate_terms(points[:, p]) for p in range(len(variables))]
+
+    params = None
+    if len(variables) > 2:
+        k = top_terms if k is None else k
+        params = [best_terms(terms[p], points, y, p, k) for p in range(len(variables))]
+
+    if executor is None:
+        best = search(terms, y, structures(len(variables)), params)
+    else:
+        best = search_parallel(terms, y, structures(len(variables)), params, executor)
+    return Model(to_model_str(best, variables), list(variables), name=name, adj_r2=best.adj_r2)
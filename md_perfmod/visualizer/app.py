@@ -1,42 +1,54 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import pickle
-
-import base64
 import dash
 import dash_html_components as html
 import os
 import pandas as pd
-import plotly.graph_objs as go
-from dash.dependencies import Input, Output
-from flask_caching import Cache
+from concurrent.futures import ThreadPoolExecutor
+from dash.dependencies import Input, Output, State
 from functools import partial
 
+from md_perfmod.csv2store import fingerprint, load
 from md_perfmod.models import comparison
+from md_perfmod.models.model import Model
 from md_perfmod.visualizer import graphs
+from md_perfmod.visualizer.caching import ResultCache
+from md_perfmod.visualizer.filter_index import FilterIndex
+from md_perfmod.visualizer.jobs import FitJob, JobManager
 from md_perfmod.visualizer import model_creation
+from md_perfmod.visualizer import model_index
 from md_perfmod.visualizer.layout import layout
+from md_perfmod.visualizer.model_store import ModelStore, parse_key, selection_key
+
+# Partial figure updates need Dash 2.9
+Patch = getattr(dash, 'Patch', None)
 
-csv_file_path = os.path.relpath('../../ls1-bench9.3.csv')
-df = pd.read_csv(csv_file_path)
+# Result file shown by the dashboard, a benchmark CSV or a store created with csv2store [csv, parquet, feather]
+data_file_path = os.environ.get('MD_PERFMOD_DATA', os.path.relpath('../../ls1-bench9.3.csv'))
+df = load(data_file_path)
 
 app = dash.Dash()
-cache = Cache(app.server, config={'CACHE_TYPE': 'simple'})
+# Results are shared by all workers, see caching for the configuration
+cache = ResultCache(app.server, fingerprint=fingerprint(data_file_path))
+
+# Only the selection keys of the models pass through the hidden divs, the models stay on the server
+model_store = ModelStore()
 
-selectable_columns = []
-selectable_columns_values = []
-metric_columns = []
+# Models are fitted in the background, the dashboard polls the progress and shows the models as they complete
+jobs = JobManager()
+background = ThreadPoolExecutor(max_workers=2)
 
-for c in df.columns:
-    unique_val = df[c].unique()
-    if 1 < len(unique_val) < len(df) / 4:
-        selectable_columns.append(c)
-        selectable_columns_values.append(unique_val)
-    elif 1 < len(unique_val):
-        metric_columns.append(c)
+selectable_columns, selectable_columns_values, metric_columns = model_index.classify_columns(df)
 
 slider_names = [('slider%i' % i) for i in range(len(selectable_columns))]
 
+# Row sets of every slider value, so filtering only intersects precomputed sets
+filter_index = FilterIndex(df, selectable_columns)
+
+# Models fitted ahead of time for all selections, see model_index
+index_file = os.environ.get('MD_PERFMOD_MODEL_INDEX', model_index.default_index_file(data_file_path))
+precomputed = model_index.load_index(index_file, data_file_path)
+
 app.layout = layout(2, selectable_columns, selectable_columns_values, metric_columns)
 
 
@@ -54,9 +66,9 @@ def generate_table(dataframe, max_rows=None):
     )
 
 
-@app.callback(Output('model-table', 'children'), [Input('models', 'children')])
-def update_model_table(models_json):
-    models = decode(models_json)
+@app.callback(Output('model-table', 'children'), [Input('models', 'children'), Input('models-progress', 'children')])
+def update_model_table(models_json, progress):
+    models = get_models(models_json)
 
     if len(models) == 0:
         raise ValueError("No models to create table")
@@ -66,16 +78,39 @@ def update_model_table(models_json):
     return generate_table(table)
 
 
+def fitting(*keys):
+    """
+    :param keys: Selection keys from the hidden model divs
+    :return: Whether the models of any of the keys are still fitted in the background
+    """
+    running = [jobs.get(key) for key in keys]
+    return any(job is not None and not job.done() for job in running)
+
+
+def matching_models(models, combined_models):
+    """
+    Pairs the models with the combined models of the same name, models whose fit failed have no partner
+    :return: List of (model, combined model)
+    """
+    by_name = dict((m.name, m) for m in models)
+    return [(by_name[m.name], m) for m in combined_models if m.name in by_name]
+
+
 def get_bounds(variable):
     ix = selectable_columns.index(variable)
     return min(selectable_columns_values[ix]), max(selectable_columns_values[ix])
 
 
 @app.callback(Output('combined_model-table', 'children'),
-              [Input('models', 'children'), Input('combined_models', 'children')])
-def update_combined_model_table(models_json, combined_models_json):
-    models = decode(models_json)
-    combined_models = decode(combined_models_json)
+              [Input('models', 'children'), Input('combined_models', 'children'),
+               Input('models-progress', 'children'), Input('combined_models-progress', 'children')])
+def update_combined_model_table(models_json, combined_models_json, *progress):
+    # the combined models are compared to the complete set of models
+    if fitting(models_json, combined_models_json):
+        return generate_table(pd.DataFrame())
+
+    models = get_models(models_json)
+    combined_models = get_models(combined_models_json)
 
     if len(models) == 0:
         raise ValueError("No models to create table")
@@ -89,21 +124,26 @@ def update_combined_model_table(models_json, combined_models_json):
 
         bounds = list(map(get_bounds, model_combined.variables))
 
-        a = model.integrate(*bounds)
-        b = model_combined.integrate(*bounds)
+        a, _ = model.quad(*bounds)
+        b, _ = model_combined.quad(*bounds)
         error = abs(a - b)
         return name, model_str, error
 
-    data = list(map(lambda m: create_table_data(m[0], m[1]), zip(models, combined_models)))
+    data = list(map(lambda m: create_table_data(m[0], m[1]), matching_models(models, combined_models)))
     table = pd.DataFrame(data, columns=['Label', 'Model', 'Error to 2D model'])
     return generate_table(table)
 
 
 @app.callback(Output('classification-table', 'children'),
-              [Input('models', 'children'), Input('combined_models', 'children')])
-def update_classification_table(models_json, combined_models_json):
-    models = decode(models_json)
-    combined_models = decode(combined_models_json)
+              [Input('models', 'children'), Input('combined_models', 'children'),
+               Input('models-progress', 'children'), Input('combined_models-progress', 'children')])
+def update_classification_table(models_json, combined_models_json, *progress):
+    if fitting(models_json, combined_models_json):
+        return generate_table(pd.DataFrame())
+
+    models = get_models(models_json)
+    # combined models whose 2D model failed cannot be classified
+    combined_models = [m for _, m in matching_models(models, get_models(combined_models_json))]
 
     if len(models) <= 1 or len(combined_models) <= 1:
         return generate_table(pd.DataFrame())
@@ -136,193 +176,246 @@ def generate_slider_updates():
 generate_slider_updates()
 
 
-@app.callback(Output('model-graph', 'figure'),
-              [Input('sel_var1', 'value'), Input('sel_var2', 'value'), Input('sel_metric', 'value'),
-               Input('sel_compare', 'value'), Input('sel_repeat', 'value'), Input('models', 'children')]
-              + [Input(sid, 'value') for sid in slider_names])
-def update_model_graph(sel_var1, sel_var2, sel_metric, sel_compare, sel_repeat, model_json, *args):
-    if sel_var1 is None or sel_metric is None:
+def graph_state(models, variables, sel_metric, sel_compare, sel_mesh):
+    """
+    Describes what a figure shows, to find out which traces have to be updated
+    """
+    return {'view': [variables, sel_metric, sel_compare, sel_mesh],
+            'names': [str(m.name) for m in models],
+            'models': [m.model_str for m in models]}
+
+
+def update_graph(require_var2, sel_var1, sel_var2, sel_metric, sel_compare, sel_repeat, sel_aggregate, sel_mesh,
+                 models_key, progress, *args):
+    """
+    Builds the figure of a graph. If the figure shows the same models as before, only the changed model traces and the
+    data traces are sent as a partial update.
+    :param require_var2: whether the graph needs two variables
+    :param args: slider values followed by the graph state of the current figure
+    :return: figure or partial update, graph state
+    """
+    args, previous = args[:-1], args[-1]
+    if sel_var1 is None or sel_metric is None or (require_var2 and sel_var2 is None):
         raise ValueError("Nothing selected")
 
-    models = decode(model_json)
+    models = get_models(models_key)
+    variables = [v for v in [sel_var1, sel_var2] if v is not None]
 
     # filtering
-    filtered_df = df
-    for col, val in zip(selectable_columns, args):
-        if col in [sel_var1, sel_var2, sel_metric, sel_compare, sel_repeat]:
-            continue
-        if val < 0:
-            val = df[col].unique()[val + len(df[col].unique())]
-        filtered_df = filtered_df[filtered_df[col] == val]
-
-    bounds = [(df[sel_var1].min(), df[sel_var1].max())]
-    if sel_var2 is not None:
-        bounds.append((df[sel_var2].min(), df[sel_var2].max()))
-        if sel_compare is not None:
-            data_list = graphs.two_d_graph_multi(models, bounds, filtered_df, sel_var1, sel_var2, sel_metric,
-                                                 sel_compare)
-        else:
-            data_list = graphs.two_d_graph(models, bounds, filtered_df, sel_var1, sel_var2, sel_metric)
-    else:
-        if sel_compare is not None:
-            data_list = graphs.one_d_graph_multi(models, bounds, filtered_df, sel_var1, sel_metric, sel_compare)
-        else:
-            data_list = graphs.one_d_graph(models, bounds, filtered_df, sel_var1, sel_metric)
-
-    if sel_var2 is None:
-        lo = go.Layout(
-            xaxis={'title': sel_var1},
-            yaxis={'title': sel_metric},
-            margin={'l': 40, 'b': 40, 't': 10, 'r': 0},
-            hovermode='closest'
-        )
-    else:
-        lo = go.Layout(scene=dict(
-            xaxis={'title': sel_var1},
-            yaxis={'title': sel_var2},
-            zaxis={'title': sel_metric}),
-            margin={'l': 40, 'b': 40, 't': 10, 'r': 0},
-            hovermode='closest',
-        )
-    return {
-        'data': data_list,
-        'layout': lo
-    }
+    sliders = dict(filter(lambda s: s[0] not in [sel_var1, sel_var2, sel_metric, sel_compare, sel_repeat],
+                          zip(selectable_columns, args)))
+    filtered_df = filter_index.select(df, sliders)
+
+    bounds = [(df[v].min(), df[v].max()) for v in variables]
+    state = graph_state(models, variables, sel_metric, sel_compare, sel_mesh)
+    data = graphs.data_traces(models, filtered_df, variables, sel_metric, sel_compare, sel_aggregate)
+
+    if Patch is not None and previous is not None and len(models) > 0 \
+            and previous['view'] == state['view'] and previous['names'] == state['names']:
+        # same traces as before: model traces first, then the data traces
+        changed = [i for i, (a, b) in enumerate(zip(previous['models'], state['models'])) if a != b]
+        figure = Patch()
+        for i, trace in zip(changed, graphs.model_traces(models, bounds, sel_compare, sel_mesh, changed)):
+            figure['data'][i] = trace
+        for i, trace in enumerate(data):
+            figure['data'][len(models) + i] = trace
+        return figure, state
 
+    return {
+        'data': graphs.model_traces(models, bounds, sel_compare, sel_mesh) + data,
+        'layout': graphs.figure_layout(variables, sel_metric)
+    }, state
 
-# TODO Clean me up, does not update to empty graph, etc.
-@app.callback(Output('model-graph2', 'figure'),
-              [Input('sel_var1', 'value'), Input('sel_var2', 'value'), Input('sel_metric', 'value'),
-               Input('sel_compare', 'value'), Input('sel_repeat', 'value'), Input('combined_models', 'children')]
-              + [Input(sid, 'value') for sid in slider_names])
-def update_model_graph(sel_var1, sel_var2, sel_metric, sel_compare, sel_repeat, model_json, *args):
-    if sel_var1 is None or sel_var2 is None or sel_metric is None:
-        raise ValueError("Nothing selected")
-
-    models = decode(model_json)
 
-    # filtering
-    filtered_df = df
-    for col, val in zip(selectable_columns, args):
-        if col in [sel_var1, sel_var2, sel_metric, sel_compare, sel_repeat]:
-            continue
-        if val < 0:
-            val = df[col].unique()[val + len(df[col].unique())]
-        filtered_df = filtered_df[filtered_df[col] == val]
-
-    bounds = [(df[sel_var1].min(), df[sel_var1].max())]
-    if sel_var2 is not None:
-        bounds.append((df[sel_var2].min(), df[sel_var2].max()))
-        if sel_compare is not None:
-            data_list = graphs.two_d_graph_multi(models, bounds, filtered_df, sel_var1, sel_var2, sel_metric,
-                                                 sel_compare)
-        else:
-            data_list = graphs.two_d_graph(models, bounds, filtered_df, sel_var1, sel_var2, sel_metric)
-    else:
-        if sel_compare is not None:
-            data_list = graphs.one_d_graph_multi(models, bounds, filtered_df, sel_var1, sel_metric, sel_compare)
+def generate_graph_updates():
+    for graph_id, models_id, require_var2 in [('model-graph', 'models', False),
+                                              ('model-graph2', 'combined_models', True)]:
+        app.callback(
+            [Output(graph_id, 'figure'), Output(graph_id + '-state', 'data')],
+            [Input('sel_var1', 'value'), Input('sel_var2', 'value'), Input('sel_metric', 'value'),
+             Input('sel_compare', 'value'), Input('sel_repeat', 'value'), Input('sel_aggregate', 'value'),
+             Input('sel_mesh', 'value'), Input(models_id, 'children'), Input(models_id + '-progress', 'children')]
+            + [Input(sid, 'value') for sid in slider_names],
+            [State(graph_id + '-state', 'data')]
+        )(partial(update_graph, require_var2))
+
+
+generate_graph_updates()
+
+
+def model_request(*selection):
+    """
+    Converts a selection to the arguments of model_creation.create
+    :return: variables, metric, repeat, compare, compare values, fixed values
+    """
+    return model_index.model_request(selection, selectable_columns, filter_index)
+
+
+def precomputed_models(kind, selection):
+    """
+    :param kind: 'models' or 'combined'
+    :param selection: Selected values
+    :return: Models of the selection from the model index or None if they were not precomputed
+    """
+    entry = precomputed.get(model_index.index_key(kind, selection, selectable_columns))
+    if entry is None:
+        return None
+    return [Model.from_serializable(m) for m in entry]
+
+
+def create_models(kind, selection):
+    models = precomputed_models(kind, selection)
+    if models is not None:
+        return models
+    if kind == 'combined':
+        return update_combined_model(*selection)
+    return update_model(*selection)
+
+
+def selection_complete(kind, selection):
+    sel_var1, sel_var2, sel_metric = selection[:3]
+    return sel_var1 is not None and sel_metric is not None and (kind != 'combined' or sel_var2 is not None)
+
+
+def submit_models(kind, selection):
+    """
+    Starts fitting the models of a selection in the background
+    :param kind: 'models' or 'combined'
+    :param selection: Selected values
+    :return: FitJob
+    """
+    if kind == 'combined':
+        # combined models need the one dimensional models of both variables, they are created as one task
+        return FitJob([(None, background.submit(update_combined_model, *selection))], lambda name, models: models)
+
+    request = model_request(*selection)
+    variables = request[0]
+    return FitJob(model_creation.submit(df, *request),
+                  lambda name, result: [Model(result[0], variables, name=name, adj_r2=result[1])])
+
+
+def get_models(key):
+    """
+    Returns the models of a selection key. While they are fitted in the background, the models completed so far are
+    returned. Models that are neither stored nor fitted, e.g. because they were evicted or requested from another
+    worker process, are created again.
+    :param key: Selection key from one of the hidden model divs
+    :return: List of models
+    """
+    models = model_store.get(key)
+    if models is not None:
+        return models
+    job = jobs.get(key)
+    if job is not None:
+        return job.models()
+    return model_store.get_or_create(key, create_models)
+
+
+def request_models(kind, *args):
+    """
+    Makes the models of a selection available, starting to fit them in the background if they are not cached
+    :param kind: 'models' or 'combined'
+    :param args: Selected values followed by the key of the previous selection, whose fits that have not started yet
+    are cancelled
+    :return: Selection key
+    """
+    key = selection_key(kind, *args[:-1])
+    previous = args[-1]
+    _, selection = parse_key(key)  # same values as when the models are created again from the key
+    if previous is not None and previous != key:
+        jobs.cancel(previous)
+
+    memoized = update_combined_model if kind == 'combined' else update_model
+    if model_store.get(key) is None:
+        models = precomputed_models(kind, selection)
+        cached = memoized.cached(*selection) if models is None else (models,)
+        if cached is not None:
+            model_store.put(key, cached[0])
+        elif not selection_complete(kind, selection):
+            model_store.put(key, [])
         else:
-            data_list = graphs.one_d_graph(models, bounds, filtered_df, sel_var1, sel_metric)
-
-    if sel_var2 is None:
-        lo = go.Layout(
-            xaxis={'title': sel_var1},
-            yaxis={'title': sel_metric},
-            margin={'l': 40, 'b': 40, 't': 10, 'r': 0},
-            hovermode='closest'
-        )
+            jobs.start(key, partial(submit_models, kind, selection))
+    return key
+
+
+def update_progress(kind, n_intervals, key, previous):
+    """
+    Reports the progress of the background fits and stores the models once all are completed or the job timed out.
+    Only models without failed fits are stored in the result cache, the others are fitted again when the selection is
+    requested after they were evicted from the model store.
+    :param kind: 'models' or 'combined'
+    :param n_intervals: Number of polls
+    :param key: Selection key
+    :param previous: Previous progress text
+    :return: Progress text
+    """
+    job = jobs.get(key)
+    if job is None:
+        text = ''
+    elif job.done():
+        models = job.models()
+        model_store.put(key, models)
+        done, failed, total = job.progress()
+        expired = job.expired()
+        if failed == 0:
+            _, selection = parse_key(key)
+            if kind == 'combined':
+                update_combined_model.store(models, *selection)
+            else:
+                update_model.store(models, *selection)
+        if expired:
+            job.cancel()
+        jobs.finish(key)
+        text = 'Fitted %d of %d models' % (done - failed, total) + (', timed out' if expired else '')
     else:
-        lo = go.Layout(scene=dict(
-            xaxis={'title': sel_var1},
-            yaxis={'title': sel_var2},
-            zaxis={'title': sel_metric}),
-            margin={'l': 40, 'b': 40, 't': 10, 'r': 0},
-            hovermode='closest',
-        )
-    return {
-        'data': data_list,
-        'layout': lo
-    }
+        done, failed, total = job.progress()
+        text = 'Fitting models: %d of %d done' % (done, total) + (', %d failed' % failed if failed else '')
 
+    # the graphs only have to be updated when the progress changed or for a new selection
+    if text == previous and [t['prop_id'] for t in dash.callback_context.triggered] == ['fit-interval.n_intervals']:
+        return dash.no_update
+    return text
 
-def encode(obj):
-    return base64.encodebytes(pickle.dumps(obj)).decode('ascii')
 
+def generate_model_updates():
+    for kind, div_id in [('models', 'models'), ('combined', 'combined_models')]:
+        app.callback(
+            Output(div_id, 'children'),
+            [Input('sel_var1', 'value'), Input('sel_var2', 'value'), Input('sel_metric', 'value'),
+             Input('sel_compare', 'value'), Input('sel_repeat', 'value')]
+            + [Input(sid, 'value') for sid in slider_names],
+            [State(div_id, 'children')]
+        )(partial(request_models, kind))
 
-def decode(json):
-    return pickle.loads(base64.decodebytes(json.encode('ascii')))
+        app.callback(
+            Output(div_id + '-progress', 'children'),
+            [Input('fit-interval', 'n_intervals'), Input(div_id, 'children')],
+            [State(div_id + '-progress', 'children')]
+        )(partial(update_progress, kind))
 
 
-@app.callback(Output('models', 'children'),
-              [Input('sel_var1', 'value'), Input('sel_var2', 'value'), Input('sel_metric', 'value'),
-               Input('sel_compare', 'value'), Input('sel_repeat', 'value')]
-              + [Input(sid, 'value') for sid in slider_names])
-def update_model_wrap(sel_var1, sel_var2, sel_metric, sel_compare, sel_repeat, *slider_vals):
-    return update_model(sel_var1, sel_var2, sel_metric, sel_compare, sel_repeat, *slider_vals)
+generate_model_updates()
 
 
 @cache.memoize()
 def update_model(sel_var1, sel_var2, sel_metric, sel_compare, sel_repeat, *slider_vals):
     # variable and metric must be selected
     if sel_var1 is None or sel_metric is None:
-        return encode(list())
-
-    if sel_compare is None:
-        comp_values = None
-    else:
-        comp_values = df[sel_compare].unique()
-
-    fixed = dict(
-        filter(lambda s: s[0] not in [sel_var1, sel_var2, sel_metric, sel_compare],
-               zip(selectable_columns, slider_vals)))
-
-    for k, v in fixed.items():
-        if v < 0:
-            col = df[k].unique()
-            fixed[k] = col[v + len(col)]
+        return list()
 
-    variables = [sel_var1]
-    if sel_var2 is not None:
-        variables.append(sel_var2)
+    return model_creation.create(df, *model_request(sel_var1, sel_var2, sel_metric, sel_compare, sel_repeat,
+                                                    *slider_vals))
 
-    models = model_creation.create(csv_file_path, variables, sel_metric, sel_repeat, sel_compare, comp_values, fixed)
 
-    return encode(models)
-
-
-@app.callback(Output('combined_models', 'children'),
-              [Input('sel_var1', 'value'), Input('sel_var2', 'value'), Input('sel_metric', 'value'),
-               Input('sel_compare', 'value'), Input('sel_repeat', 'value')]
-              + [Input(sid, 'value') for sid in slider_names])
 @cache.memoize()
 def update_combined_model(sel_var1, sel_var2, sel_metric, sel_compare, sel_repeat, *slider_vals):
     if sel_var1 is None or sel_var2 is None or sel_metric is None:
-        return encode(list())
-
-    def mid_val(ll):  # similar to median, when even number of values takes the larger 'middle' value
-        sl = sorted(ll)
-        item = None
-        while len(sl) >= 2:
-            item = sl.pop()
-            sl.pop(0)
-        if len(sl) == 1:
-            return sl[0]
-        else:
-            return item
-
-    # one d models for single var with other vars fixed
-    def one_d_model(variable, others):
-        fixed = list(slider_vals)
-        for other in others:
-            col_ix = selectable_columns.index(other)
-            fixed[col_ix] = mid_val(selectable_columns_values[col_ix])
-        models = update_model(variable, None, sel_metric, sel_compare, sel_repeat, *fixed)
-        return decode(models)
-
-    variables = [sel_var1, sel_var2]
-    single_models = list(map(lambda v: one_d_model(v, [x for x in variables if x != v]), variables))
-    combined_models = list(map(lambda m: comparison.combine(*m, combined_name=m[0].name), zip(*single_models)))
-    return encode(combined_models)
+        return list()
+
+    # one d models for single var with the other var fixed
+    selections = model_index.combined_selections([sel_var1, sel_var2, sel_metric, sel_compare, sel_repeat] +
+                                                 list(slider_vals), selectable_columns, selectable_columns_values)
+    return model_index.combine_all([update_model(*s) for s in selections])
 
 
 if __name__ == '__main__':
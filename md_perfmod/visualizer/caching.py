@@ -0,0 +1,129 @@
+"""Cache for the results of the dashboard callbacks
+
+The cache backend is configured with environment variables:
+  MD_PERFMOD_CACHE_TYPE       'filesystem' (shared by all workers on a host), 'redis' (shared by all hosts) or
+                              'simple' (one cache per process) [default: filesystem]
+  MD_PERFMOD_CACHE_URL        Redis url, e.g. redis://localhost:6379/0 [default: redis on localhost]
+  MD_PERFMOD_DASH_CACHE_DIR   Directory of the filesystem cache [default: ~/.cache/md-perfmod/dashboard]
+  MD_PERFMOD_CACHE_TTL        Seconds until an entry expires, 0 for never [default: 86400]
+  MD_PERFMOD_CACHE_THRESHOLD  Maximum number of entries of the filesystem and simple cache [default: 500]
+
+The keys include a fingerprint of the result file, so results of a previous version of the file are not used.
+"""
+import functools
+import hashlib
+import os
+import pickle
+import threading
+
+from flask import jsonify
+from flask_caching import Cache
+
+CACHE_TYPES = ('filesystem', 'redis', 'simple')
+
+
+def cache_config(environ=os.environ):
+    """
+    Creates the Flask-Caching configuration from environment variables
+    :param environ: Environment variables
+    :return: Configuration dictionary
+    """
+    cache_type = environ.get('MD_PERFMOD_CACHE_TYPE', 'filesystem')
+    if cache_type not in CACHE_TYPES:
+        raise ValueError('Unknown cache type `%s`. Available: %s' % (cache_type, CACHE_TYPES))
+
+    config = {
+        'CACHE_TYPE': cache_type,
+        'CACHE_DEFAULT_TIMEOUT': int(environ.get('MD_PERFMOD_CACHE_TTL', 86400)),
+        'CACHE_THRESHOLD': int(environ.get('MD_PERFMOD_CACHE_THRESHOLD', 500)),
+        'CACHE_KEY_PREFIX': 'md-perfmod:',
+    }
+    if cache_type == 'filesystem':
+        config['CACHE_DIR'] = environ.get('MD_PERFMOD_DASH_CACHE_DIR', os.path.join(
+            os.path.expanduser('~'), '.cache', 'md-perfmod', 'dashboard'))
+    elif cache_type == 'redis':
+        config['CACHE_REDIS_URL'] = environ.get('MD_PERFMOD_CACHE_URL', 'redis://localhost:6379/0')
+    return config
+
+
+class CacheStats:
+    def __init__(self):
+        """
+        Hit and miss counters per memoized function of this process
+        """
+        self.hits = {}
+        self.misses = {}
+        self.lock = threading.Lock()
+
+    def count(self, name, hit):
+        with self.lock:
+            counter = self.hits if hit else self.misses
+            counter[name] = counter.get(name, 0) + 1
+
+    def summary(self):
+        """
+        :return: Dictionary with the hits, misses and hit rate of each function
+        """
+        with self.lock:
+            result = {}
+            for name in sorted(set(self.hits) | set(self.misses)):
+                hits, misses = self.hits.get(name, 0), self.misses.get(name, 0)
+                result[name] = {'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses)}
+            return result
+
+
+class ResultCache:
+    def __init__(self, server, config=None, stats_route='/cache-stats', fingerprint=''):
+        """
+        Cache shared by all workers according to the configuration with hit/miss statistics
+        :param server: Flask server of the dashboard
+        :param config: Flask-Caching configuration [default: from the environment, see cache_config]
+        :param stats_route: Route returning the statistics as JSON or None to not add it
+        :param fingerprint: Identifies the data the results are computed from, e.g. csv2store.fingerprint of the
+        result file. Results of other data, e.g. of a previous version of the file, are not used.
+        """
+        self.namespace = hashlib.sha256(fingerprint.encode()).hexdigest()[:16]
+        self.config = cache_config() if config is None else config
+        self.cache = Cache(server, config=self.config)
+        self.stats = CacheStats()
+        if stats_route is not None:
+            server.add_url_rule(stats_route, 'cache_stats', self.stats_view)
+
+    def stats_view(self):
+        return jsonify(type=self.config['CACHE_TYPE'], pid=os.getpid(), functions=self.stats.summary())
+
+    def memoize(self, timeout=None):
+        """
+        Decorator caching the results of a function by its arguments. The arguments must be picklable.
+        The decorated function has the attributes cached(*args), returning the (result,) tuple or None, and
+        store(result, *args) to access the cache without calling the function.
+        :param timeout: Seconds until an entry expires [default: configured TTL]
+        :return: Decorator
+        """
+        def decorator(fun):
+            name = '%s.%s' % (fun.__module__, fun.__qualname__)
+
+            def make_key(args):
+                return '%s:%s:%s' % (name, self.namespace, hashlib.sha256(pickle.dumps(args)).hexdigest())
+
+            @functools.wraps(fun)
+            def wrapper(*args):
+                key = make_key(args)
+                entry = self.cache.get(key)
+                # results are wrapped in a tuple, so cached None results can be told apart from misses
+                self.stats.count(name, entry is not None)
+                if entry is not None:
+                    return entry[0]
+                result = fun(*args)
+                self.cache.set(key, (result,), timeout=timeout)
+                return result
+
+            # for results computed elsewhere, e.g. in the background
+            wrapper.cached = lambda *args: self.cache.get(make_key(args))
+            wrapper.store = lambda result, *args: self.cache.set(make_key(args), (result,), timeout=timeout)
+            return wrapper
+
+        return decorator
+
+    def clear(self):
+        self.cache.clear()
@@ -0,0 +1,72 @@
+"""Index for filtering the benchmark data by the slider values"""
+import numpy as np
+import pandas as pd
+
+
+class FilterIndex:
+    def __init__(self, data, columns):
+        """
+        Builds the row sets of every value of the given columns
+        :param data: Data frame
+        :param columns: Columns that can be fixed to a value
+        """
+        self.uniques = {}  # column: values in the order of appearance like Series.unique
+        self.codes = {}  # column: {value: code}
+        self.row_codes = {}  # column: code of every row
+        self.rows = {}  # column: sorted row positions per code
+        for column in columns:
+            codes, uniques = pd.factorize(data[column], sort=False)
+            uniques = np.asarray(uniques)
+            order = np.argsort(codes, kind='stable')
+            counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+            start = np.count_nonzero(codes < 0)  # missing values are not part of any row set
+            self.uniques[column] = uniques
+            self.codes[column] = dict((v, i) for i, v in enumerate(uniques.tolist()))
+            self.row_codes[column] = codes
+            self.rows[column] = np.split(order[start:], np.cumsum(counts)[:-1])
+
+    def resolve(self, column, value):
+        """
+        Converts a slider value to the column value. Negative slider values select the value at this position from
+        the end of the unique values (used for text columns).
+        :param column: Column
+        :param value: Slider value
+        :return: Column value
+        """
+        if value < 0:
+            uniques = self.uniques[column]
+            return uniques[value + len(uniques)]
+        return value
+
+    def positions(self, fixed):
+        """
+        Finds the rows matching all fixed values
+        :param fixed: Dict of column: value, values are not resolved
+        :return: Sorted array of row positions or None if nothing is fixed
+        """
+        conditions = []
+        for column, value in fixed.items():
+            code = self.codes[column].get(value)
+            if code is None:
+                return np.empty(0, dtype=np.intp)
+            conditions.append((len(self.rows[column][code]), column, code))
+        if len(conditions) == 0:
+            return None
+
+        # start with the smallest row set and only check the codes of its rows for the other columns
+        conditions.sort(key=lambda c: c[0])
+        _, column, code = conditions[0]
+        result = self.rows[column][code]
+        for _, column, code in conditions[1:]:
+            result = result[self.row_codes[column][result] == code]
+        return result
+
+    def select(self, data, sliders):
+        """
+        Filters the data by slider values
+        :param data: The data frame the index was built for
+        :param sliders: Dict of column: slider value
+        :return: Filtered data frame
+        """
+        rows = self.positions(dict((c, self.resolve(c, v)) for c, v in sliders.items()))
+        return data if rows is None else data.iloc[rows]
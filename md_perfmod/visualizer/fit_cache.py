@@ -0,0 +1,120 @@
+"""Persistent on-disk cache for fitted models"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+default_directory = os.environ.get('MD_PERFMOD_CACHE_DIR',
+                                   os.path.join(os.path.expanduser('~'), '.cache', 'md-perfmod', 'fits'))
+default_max_entries = 4096
+
+
+def command_version(command):
+    """
+    Identifies the installed version of a modeler command by its location and modification time
+    :param command: Name of the executable
+    :return: String changing whenever the executable is replaced
+    """
+    path = shutil.which(command)
+    if path is None:
+        return command
+    return '%s:%d' % (path, os.stat(path).st_mtime_ns)
+
+
+def fit_key(extrap_input, commands):
+    """
+    Creates the cache key of a fit
+    :param extrap_input: Text of the extrap input file
+    :param commands: Commands used for fitting the model
+    :return: Hex digest identifying the fit
+    """
+    digest = hashlib.sha256()
+    for command in commands:
+        digest.update(command_version(command).encode('utf-8'))
+        digest.update(b'\0')
+    digest.update(extrap_input.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class FitCache:
+    def __init__(self, directory=default_directory, max_entries=default_max_entries):
+        """
+        Cache storing (model_str, adj_r2) tuples as files, evicting the least recently used entries
+        :param directory: Directory containing the cache entries
+        :param max_entries: Maximum number of entries kept on disk
+        """
+        self.directory = directory
+        self.max_entries = max_entries
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def get(self, key):
+        """
+        Looks up a fit
+        :param key: Key created by fit_key
+        :return: (model_str, adj_r2) or None if the fit is not cached
+        """
+        path = self._path(key)
+        try:
+            with open(path) as file:
+                entry = json.load(file)
+            os.utime(path)  # mark as recently used
+        except (OSError, ValueError):
+            return None
+        return entry['model'], entry['adj_r2']
+
+    def put(self, key, model_str, adj_r2):
+        """
+        Stores a fit and evicts the least recently used entries if the cache is full
+        :param key: Key created by fit_key
+        :param model_str: Model as string
+        :param adj_r2: Adjusted r^2 of the model
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as file:
+            json.dump({'model': model_str, 'adj_r2': adj_r2}, file)
+        os.replace(tmp_path, self._path(key))  # atomic, concurrent writers of the same fit do not conflict
+        self.evict()
+
+    def entries(self):
+        """
+        :return: Paths of all cache entries
+        """
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.directory, n) for n in names if n.endswith('.json')]
+
+    def evict(self):
+        """
+        Removes the least recently used entries until at most max_entries are left
+        """
+        entries = self.entries()
+        if len(entries) <= self.max_entries:
+            return
+
+        def mtime(path):
+            try:
+                return os.stat(path).st_mtime
+            except FileNotFoundError:
+                return 0
+
+        for path in sorted(entries, key=mtime)[:len(entries) - self.max_entries]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # removed by another process
+
+    def clear(self):
+        """
+        Removes all cache entries
+        """
+        for path in self.entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
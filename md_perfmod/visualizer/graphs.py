@@ -1,139 +1,238 @@
+import os
+from functools import lru_cache
+
 import colorlover as cl
 import numpy as np
 import plotly.graph_objs as go
 
-
-def one_d_graph(models, bounds, filtered_df, sel_var1, sel_metric):
-    x, samples = models[0].sample(*bounds)
-    options_m = dict(
-        x=x[0],
-        y=samples,
-        name='model',
-        legendgroup='1',
-    )
-    options_d = dict(
-        x=filtered_df[sel_var1],
-        y=filtered_df[sel_metric],
-        mode='markers',
-        name='data',
-        legendgroup='1',
-    )
-
-    return [go.Scatter(options_m), go.Scatter(options_d)]
-
-
-def one_d_graph_multi(models, bounds, filtered_df, sel_var1, sel_metric, sel_compare):
-    data_list = []
-    split_dfs = [frame for frame in filtered_df.groupby(sel_compare)]
-
-    num_colors = len(models) + len(split_dfs)
-    for i, (region, frame) in enumerate(split_dfs):
-        name = str(region)
-        model = next(m for m in models if str(m.name) == name)
-        x, samples = model.sample(*bounds)
-        options_m = dict(
-            x=x[0],
-            y=samples,
-            name='%s: %s (model)' % (sel_compare, name),
-            legendgroup=region,
-        )
-
+from md_perfmod.models.model import Model
+
+# How the measurements at the same point are shown: every measurement, the mean with a 95% confidence interval or the
+# median with the minimum and maximum
+AGGREGATIONS = ('raw', 'mean', 'median')
+
+# How two dimensional models are drawn: a grid of lines or a surface
+MESHES = ('wireframe', 'surface')
+mesh_opacity = 0.7
+
+# Maximum number of data points per graph, above it the points are downsampled
+point_budget = int(os.environ.get('MD_PERFMOD_POINT_BUDGET', 5000))
+
+# Sample points per dimension of the model curves and number of sampled models kept
+n_evaluations = 50
+sample_cache_size = 512
+
+
+@lru_cache(maxsize=sample_cache_size)
+def _sample(model_str, variables, bounds, n):
+    x, samples = Model(model_str, list(variables)).sample(*bounds, n_evaluations=n)
+    for a in x + [samples]:
+        a.flags.writeable = False  # shared by all figures using the model
+    return x, samples
+
+
+def sample(model, bounds, n=None):
+    """
+    Samples a model, reusing the samples of the same model, bounds and resolution
+    :param model: Model
+    :param bounds: (low, high) tuples for each variable of the model
+    :param n: Sample points per dimension [default: n_evaluations]
+    :return: List of x values in each dimension, array with the samples
+    """
+    bounds = tuple((float(low), float(high)) for low, high in bounds)
+    return _sample(model.model_str, tuple(model.variables), bounds, n_evaluations if n is None else n)
+
+
+def downsample(frame, budget):
+    """
+    Selects evenly spaced rows if there are more rows than the budget
+    :param frame: Data frame
+    :param budget: Maximum number of rows
+    :return: Data frame with at most budget rows
+    """
+    if len(frame) <= budget:
+        return frame
+    return frame.iloc[np.linspace(0, len(frame) - 1, max(budget, 1)).astype(int)]
+
+
+def data_options(frame, variables, sel_metric, aggregation='raw', budget=None):
+    """
+    Creates the coordinates of the data points of a trace
+    :param frame: Measurements
+    :param variables: Variable columns (one or two)
+    :param sel_metric: Metric column
+    :param aggregation: One of AGGREGATIONS
+    :param budget: Maximum number of points [default: point_budget]
+    :return: Dict with the x, y (and z) coordinates and error bars of the metric for aggregated points
+    """
+    if aggregation not in AGGREGATIONS:
+        raise ValueError('Unknown aggregation `%s`. Available: %s' % (aggregation, AGGREGATIONS))
+    budget = point_budget if budget is None else budget
+    axes = ['x', 'y', 'z'][:len(variables) + 1]
+
+    if aggregation == 'raw':
+        frame = downsample(frame, budget)
+        return dict(zip(axes, [frame[c] for c in list(variables) + [sel_metric]]))
+
+    stats = frame.groupby(list(variables), observed=True, sort=True)[sel_metric] \
+        .agg(['mean', 'median', 'std', 'count', 'min', 'max']).reset_index()
+    stats = downsample(stats, budget)
+    if aggregation == 'mean':
+        center = stats['mean']
+        # normal approximation of the 95% confidence interval of the mean
+        half_width = (1.96 * stats['std'] / np.sqrt(stats['count'])).fillna(0)
+        minus, plus = half_width, half_width
+    else:
+        center = stats['median']
+        minus, plus = center - stats['min'], stats['max'] - center
+
+    options = dict(zip(axes, [stats[c] for c in variables] + [center]))
+    options['error_' + axes[-1]] = dict(type='data', symmetric=False, array=plus, arrayminus=minus)
+    return options
+
+
+def trace_colors(i, n_models):
+    """
+    Colours of the model and the data of a compare value
+    :param i: Index of the model
+    :param n_models: Number of models
+    :return: Colour of the model, colour of the data or None, None to use the default colours
+    """
+    if 2 <= n_models <= 6:
+        colors = cl.scales[str(2 * n_models)]['qual']['Paired']
+        return colors[2 * i], colors[2 * i + 1]
+    elif 6 < n_models <= 9:
+        colors = cl.scales[str(n_models)]['qual']['Set1']
+        return colors[i], colors[i]
+    return None, None
+
+
+def trace_names(model, sel_compare):
+    if sel_compare is None:
+        return 'model', 'data', '1'
+    name = str(model.name)
+    return '%s: %s (model)' % (sel_compare, name), '%s: %s (data)' % (sel_compare, name), name
+
+
+def model_traces(models, bounds, sel_compare=None, mesh='wireframe', indices=None, opacities=None):
+    """
+    Creates one trace per model
+    :param models: Models of one or two variables
+    :param bounds: (low, high) tuples for each variable
+    :param sel_compare: Compare column the models are named by or None for a single model
+    :param mesh: How two dimensional models are drawn, one of MESHES
+    :param indices: Indices of the models to create traces for [default: all models]
+    :param opacities: Dict of compare value (model name as string) to the opacity of its two dimensional model
+    [default: see create_mesh]
+    :return: List of traces
+    """
+    opacities = {} if opacities is None else opacities
+    traces = []
+    for i in range(len(models)) if indices is None else indices:
+        model = models[i]
+        name, _, group = trace_names(model, sel_compare)
+        color, _ = trace_colors(i, len(models))
+        if sel_compare is None:
+            color = '#1f77b4'
+        x, samples = sample(model, bounds)
+        if len(bounds) == 1:
+            options_m = dict(x=x[0], y=samples, name=name, legendgroup=group)
+            if color is not None:
+                options_m['line'] = dict(color=color)
+            traces.append(go.Scatter(options_m))
+        else:
+            options_m = dict(name=name, showlegend=True, mode='lines', legendgroup=group,
+                             line=dict(width=3) if color is None else dict(color=color, width=3))
+            traces += create_mesh(x, samples, options_m, mesh, opacities.get(str(model.name)))
+    return traces
+
+
+def data_traces(models, filtered_df, variables, sel_metric, sel_compare=None, aggregation='raw'):
+    """
+    Creates one trace with the measurements per model. The trace is empty if there are no measurements.
+    :param models: Models
+    :param filtered_df: Measurements
+    :param variables: Variable columns (one or two)
+    :param sel_metric: Metric column
+    :param sel_compare: Compare column the models are named by or None for a single model
+    :param aggregation: One of AGGREGATIONS
+    :return: List of traces
+    """
+    if sel_compare is None:
+        frames = {None: filtered_df}
+    else:
+        frames = dict((str(v), frame) for v, frame in filtered_df.groupby(sel_compare, observed=True))
+    budget = point_budget // max(len(frames), 1)
+
+    scatter = go.Scatter if len(variables) == 1 else go.Scatter3d
+    traces = []
+    for i, model in enumerate(models):
+        _, name, group = trace_names(model, sel_compare)
+        _, color = trace_colors(i, len(models))
+        if sel_compare is None:
+            color = '#ff7f0e'
+        frame = frames.get(None if sel_compare is None else str(model.name), filtered_df.iloc[:0])
         options_d = dict(
-            x=frame[sel_var1],
-            y=frame[sel_metric],
             mode='markers',
-            name='%s: %s (data)' % (sel_compare, name),
-            legendgroup=region,
-        )
-
-        if 3 < num_colors < 13:
-            colors = cl.scales[str(num_colors)]['qual']['Paired']
-            options_m['line'] = dict(color=colors[2 * i])
-            options_d['marker'] = dict(color=colors[2 * i + 1])
-        elif num_colors < 25:
-            colors = cl.scales[str(num_colors)]['qual']['Set1']
-            options_m['line'] = dict(color=colors[i])
-            options_d['marker'] = dict(color=colors[i])
-
-        data_list += [go.Scatter(options_m), go.Scatter(options_d)]
-
-    return data_list
-
-
-def two_d_graph(models, bounds, filtered_df, sel_var1, sel_var2, sel_metric):
-    x, samples = models[0].sample(*bounds)
-    options_m = dict(
-        name='model',
-        showlegend=True,
-        mode='lines',
-        line=dict(color='#1f77b4', width=3),
-    )
-    options_d = dict(
-        x=filtered_df[sel_var1],
-        y=filtered_df[sel_var2],
-        z=filtered_df[sel_metric],
-        mode='markers',
-        marker=dict(color='#ff7f0e'),
-        name='data',
-    )
-
-    return create_mesh(x, samples, options_m) + [go.Scatter3d(options_d)]
-
-
-def create_mesh(x, samples, options_m):
-    data_list = []
-    x_grid, y_grid = np.meshgrid(x[0], x[1])
-    for a, b, c in zip(x_grid, y_grid, samples.T):
-        options_m['x'] = a
-        options_m['y'] = b
-        options_m['z'] = c
-        data_list.append(go.Scatter3d(options_m))
-        options_m['showlegend'] = False
-
-    y_grid, x_grid = np.meshgrid(x[1], x[0])
-    for a, b, c in zip(x_grid, y_grid, samples):
-        options_m['x'] = a
-        options_m['y'] = b
-        options_m['z'] = c
-        data_list.append(go.Scatter3d(options_m))
-
-    return data_list
-
-
-def two_d_graph_multi(models, bounds, filtered_df, sel_var1, sel_var2, sel_metric, sel_compare):
-    data_list = []
-    split_dfs = [frame for frame in filtered_df.groupby(sel_compare)]
-
-    num_colors = len(models) + len(split_dfs)
-    for i, (region, frame) in enumerate(split_dfs):
-        name = str(region)
-        model = next(m for m in models if str(m.name) == name)
-        x, samples = model.sample(*bounds)
-        options_m = dict(
-            name='%s: %s (model)' % (sel_compare, name),
-            mode='lines',
-            line=dict(width=2),
-            legendgroup=region,
+            name=name,
+            legendgroup=group,
+            **data_options(frame, variables, sel_metric, aggregation, budget)
         )
-
-        options_d = dict(
-            x=frame[sel_var1],
-            y=frame[sel_var2],
-            z=frame[sel_metric],
-            mode='markers',
-            name='%s: %s (data)' % (sel_compare, name),
-            legendgroup=region,
+        if color is not None:
+            options_d['marker'] = dict(color=color)
+        traces.append(scatter(options_d))
+    return traces
+
+
+def figure_layout(variables, sel_metric):
+    if len(variables) == 1:
+        return go.Layout(
+            xaxis={'title': variables[0]},
+            yaxis={'title': sel_metric},
+            margin={'l': 40, 'b': 40, 't': 10, 'r': 0},
+            hovermode='closest'
         )
+    return go.Layout(scene=dict(
+        xaxis={'title': variables[0]},
+        yaxis={'title': variables[1]},
+        zaxis={'title': sel_metric}),
+        margin={'l': 40, 'b': 40, 't': 10, 'r': 0},
+        hovermode='closest',
+    )
 
-        if 3 < num_colors < 13:
-            colors = cl.scales[str(num_colors)]['qual']['Paired']
-            options_m['line'] = dict(color=colors[2 * i], width=3)
-            options_d['marker'] = dict(color=colors[2 * i + 1])
-        elif num_colors < 25:
-            colors = cl.scales[str(num_colors)]['qual']['Set1']
-            options_m['line'] = dict(color=colors[i], width=3)
-            options_d['marker'] = dict(color=colors[i])
-
-        data_list += [go.Scatter3d(options_d)] + create_mesh(x, samples, options_m)
 
-    return data_list
+def create_mesh(x, samples, options_m, mesh='wireframe', opacity=None):
+    """
+    Creates a single trace showing a two dimensional model
+    :param x: Sample positions of both variables
+    :param samples: Samples of shape (len(x[0]), len(x[1]))
+    :param options_m: Options of the model trace (name, legendgroup, line, ...)
+    :param mesh: One of MESHES
+    :param opacity: Opacity of the trace [default: mesh_opacity for surfaces, opaque for wireframes]
+    :return: List with the trace
+    """
+    if mesh not in MESHES:
+        raise ValueError('Unknown mesh `%s`. Available: %s' % (mesh, MESHES))
+
+    if mesh == 'surface':
+        options = dict((k, v) for k, v in options_m.items() if k not in ('mode', 'line'))
+        color = options_m.get('line', {}).get('color')
+        if color is not None:
+            options['colorscale'] = [[0, color], [1, color]]  # one colour per model
+        options.update(x=x[0], y=x[1], z=samples.T, showscale=False, showlegend=True,
+                       opacity=mesh_opacity if opacity is None else opacity)
+        return [go.Surface(options)]
+
+    # lines along the first variable for each value of the second and vice versa, separated by NaN
+    x_grid, y_grid = np.meshgrid(x[0], x[1], indexing='ij')
+    gap = np.full((1, x_grid.shape[1]), np.nan)
+    along_x = [np.vstack([a, gap]).T.ravel() for a in (x_grid, y_grid, samples)]
+    gap = np.full((x_grid.shape[0], 1), np.nan)
+    along_y = [np.hstack([a, gap]).ravel() for a in (x_grid, y_grid, samples)]
+
+    options = dict(options_m)
+    options.update(x=np.concatenate([along_x[0], along_y[0]]), y=np.concatenate([along_x[1], along_y[1]]),
+                   z=np.concatenate([along_x[2], along_y[2]]), connectgaps=False)
+    if opacity is not None:
+        options['opacity'] = opacity
+    return [go.Scatter3d(options)]
@@ -0,0 +1,116 @@
+"""Background fitting jobs of the dashboard"""
+import threading
+import time
+
+# Seconds after which the fits of a job that are not completed count as failed, e.g. because a fit hangs
+job_timeout = 600
+
+
+class FitJob:
+    def __init__(self, tasks, to_models, timeout=None):
+        """
+        Fits of the models of one selection running in the background
+        :param tasks: list of (name, future) with one future per fit
+        :param to_models: function converting the name and the result of a completed fit to a list of models
+        :param timeout: seconds after which the fits that are not completed count as failed [default: job_timeout]
+        """
+        self.tasks = list(tasks)
+        self.to_models = to_models
+        self.started = time.time()
+        self.deadline = self.started + (job_timeout if timeout is None else timeout)
+        self.cancelled = False
+
+    def progress(self):
+        """
+        :return: number of completed fits, number of failed fits, total number of fits. After the deadline all fits
+        count as completed and the ones still running as failed.
+        """
+        done = [future for _, future in self.tasks if future.done()]
+        failed = [future for future in done if future.cancelled() or future.exception() is not None]
+        if self.expired():
+            return len(self.tasks), len(failed) + len(self.tasks) - len(done), len(self.tasks)
+        return len(done), len(failed), len(self.tasks)
+
+    def expired(self):
+        """
+        :return: Whether the deadline passed before all fits completed
+        """
+        return time.time() > self.deadline and not all(future.done() for _, future in self.tasks)
+
+    def done(self):
+        """
+        :return: Whether all fits completed or the deadline passed
+        """
+        return all(future.done() for _, future in self.tasks) or self.expired()
+
+    def models(self):
+        """
+        Models of the fits completed so far in the order of the tasks
+        :return: List of models
+        """
+        models = []
+        for name, future in self.tasks:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                models += self.to_models(name, future.result())
+        return models
+
+    def cancel(self):
+        """
+        Cancels the fits that have not started yet. Running fits are not stopped, they complete in the background and
+        their results are not used by this job.
+        """
+        self.cancelled = True
+        for _, future in self.tasks:
+            future.cancel()
+
+
+class JobManager:
+    def __init__(self):
+        """
+        Thread-safe registry of the running jobs by selection key
+        """
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def start(self, key, submit):
+        """
+        Starts a job unless a job with the same key is running already
+        :param key: Selection key
+        :param submit: Function submitting the fits and returning the FitJob
+        :return: FitJob
+        """
+        with self.lock:
+            job = self.jobs.get(key)
+            if job is None or job.cancelled:
+                job = submit()
+                self.jobs[key] = job
+            return job
+
+    def get(self, key):
+        """
+        :param key: Selection key
+        :return: Running job or None
+        """
+        with self.lock:
+            return self.jobs.get(key)
+
+    def finish(self, key):
+        """
+        Removes a completed job
+        :param key: Selection key
+        :return: The removed job or None
+        """
+        with self.lock:
+            return self.jobs.pop(key, None)
+
+    def cancel(self, key):
+        """
+        Removes a job and cancels its fits that have not started yet, e.g. because the selection changed
+        :param key: Selection key
+        """
+        job = self.finish(key)
+        if job is not None:
+            job.cancel()
+
+    def __len__(self):
+        return len(self.jobs)
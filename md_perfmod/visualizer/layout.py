@@ -18,6 +18,18 @@ def combo_box(name, hid, cols, num_boxes):
     ]
 
 
+def radio_items(name, hid, options, value):
+    return html.Div([
+        html.Label(name, htmlFor=hid),
+        dcc.RadioItems(
+            id=hid,
+            options=[{'label': label, 'value': v} for v, label in options],
+            value=value,
+            labelStyle={'display': 'inline-block', 'margin-right': '1em'},
+        )
+    ], style={'margin': '0 1em', 'clear': 'both'})
+
+
 def slider_marks(l):
     result = dict()
     for i, e in enumerate(l):
@@ -66,13 +78,21 @@ def layout(num_variables, selectable_columns, selectable_columns_values, metric_
         html.H1('Benchmark visualization'),
 
         html.Div(cmb_boxes),
+        radio_items('Data points', 'sel_aggregate',
+                    [('raw', 'All measurements'), ('mean', 'Mean (95% confidence interval)'),
+                     ('median', 'Median (min/max)')], 'raw'),
+        radio_items('2D models', 'sel_mesh', [('wireframe', 'Wireframe'), ('surface', 'Surface')], 'wireframe'),
 
         html.Div([
             html.H3('Graph'),
+            html.Div(id='models-progress'),
             dcc.Graph(id='model-graph'),
+            dcc.Store(id='model-graph-state'),
             html.H5('Models'),
             html.Table(id='model-table'),
+            html.Div(id='combined_models-progress'),
             dcc.Graph(id='model-graph2'),
+            dcc.Store(id='model-graph2-state'),
         ], style={'width': '49%', 'float': 'left', 'display': 'inline-block'}),
         html.Div([
             html.H3('Fixed values'),
@@ -86,6 +106,7 @@ def layout(num_variables, selectable_columns, selectable_columns_values, metric_
         ], style={'width': '48%', 'float': 'left', 'display': 'inline-block'}),
 
         html.Div([], style={'margin-top': '4em'}),
+        dcc.Interval(id='fit-interval', interval=1000),
         html.Div(id='models', style={'display': 'none'}),
         html.Div(id='combined_models', style={'display': 'none'}),
     ])
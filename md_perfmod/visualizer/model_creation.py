@@ -1,111 +1,427 @@
 """Creating models with extrap"""
+import atexit
 import csv
+import io
 import multiprocessing
+import os
+import signal
 import subprocess
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
 
+import numpy as np
+import pandas as pd
 import re
 import tempfile
-from pathos.multiprocessing import ProcessPool as Pool
 
-from md_perfmod.csv2extrap import perform_conversion, Parameters
+from md_perfmod import csv2store
+from md_perfmod.csv2extrap import grouped_conversion, grouped_conversion_by, write_extrap_grouped, Parameters
+from md_perfmod.models import pmnf
 from md_perfmod.models.model import Model
+from md_perfmod.visualizer.fit_cache import FitCache, fit_key
 
+try:
+    # Extra-P 4 can be used in-process instead of calling the command line tools
+    import extrap as extrap_api
+    from extrap.fileio.file_reader.text_file_reader import TextFileReader
+    from extrap.modelers.model_generator import ModelGenerator
+    from extrap.util.exceptions import RecoverableError
+except ImportError:
+    extrap_api = None
 
-def convert(file, variables, metric, repeat, fixed):
+# Available modelers: Extra-P or the built-in PMNF least squares modeler
+MODELERS = ('extrap', 'native')
+
+# Commands used for fitting models depending on the number of parameters
+one_param_commands = ('extrap-modeler', 'extrap-print')
+two_param_commands = ('exp_two_param',)
+
+
+class FitError(RuntimeError):
+    """A modeler failed to fit a model or its output could not be read"""
+
+
+# Errors of a single fit that only cause the model to be skipped
+fit_errors = (subprocess.CalledProcessError, subprocess.TimeoutExpired, TimeoutError, FitError)
+if extrap_api is not None:
+    fit_errors += (RecoverableError,)
+
+fit_cache = FitCache()
+
+# Directory for the files of the command line tools, e.g. node local storage [default: system temp directory]
+scratch_dir = os.environ.get('MD_PERFMOD_SCRATCH')
+
+# Worker pool shared by all calls to create
+max_workers = multiprocessing.cpu_count()
+fit_timeout = 60  # seconds per fit, enforced by the workers where SIGALRM is available
+worker_timeouts = hasattr(signal, 'setitimer')
+_pool = None
+_pool_lock = threading.Lock()
+
+# Thread for fits that coordinate work in the worker pool themselves
+_threads = None
+
+
+def load(file):
     """
-    Convert a csv file to extrap input
-    :param file: csv file
+    Loads a csv file unless it is a data frame already
+    :param file: csv file or data frame
+    :return: data frame
+    """
+    if isinstance(file, pd.DataFrame):
+        return file
+    return csv2store.load(file)
+
+
+def write_input(grouped, variables, metric):
+    """
+    Write grouped measurements as extrap input
+    :param grouped: measurements grouped by point
     :param variables: list of variable columns
     :param metric: metric column
-    :param repeat: repeat column or None
-    :param fixed: dictionary of column:value to fix
-    :return: path to the created extrap input file
+    :return: extrap input as string
+    """
+    params = Parameters(vars=variables, metric=metric, repeat=None, fixed={}, experiment='exp', file_in=None,
+                        file_out=None, chunksize=None)
+    buffer = io.StringIO()
+    write_extrap_grouped(buffer, grouped, params)
+    return buffer.getvalue()
+
+
+def parse(pattern, text, tool):
+    """
+    Reads a value from the output of a modeler
+    :param pattern: regular expression with the value as first group
+    :param text: output
+    :param tool: name of the modeler for the error message
+    :return: value as string
     """
-    _, tmp_file = tempfile.mkstemp()
-    params = Parameters(vars=variables, metric=metric, repeat=repeat, fixed=fixed, experiment='exp', file_in=file,
-                        file_out=tmp_file)
-    perform_conversion(params)
-    return tmp_file
+    match = re.search(pattern, text)
+    if match is None:
+        raise FitError('Unexpected output of %s: %s' % (tool, text))
+    return match.group(1)
 
 
-def extrap_one_param(file_in):
+def write_scratch(directory, text):
+    """
+    Writes extrap input to a file in a scratch directory for tools that can only read files
+    :param directory: scratch directory
+    :param text: extrap input
+    :return: path to the file
+    """
+    path = os.path.join(directory, 'input.txt')
+    with open(path, 'w') as file:
+        file.write(text)
+    return path
+
+
+def extrap_one_param(text):
     """
     Uses extrap to create a one parameter model
-    :param file_in: extrap input
+    :param text: extrap input
     :return: model as string, adj r^2
     """
-    _, file_out = tempfile.mkstemp()
+    with tempfile.TemporaryDirectory(dir=scratch_dir) as directory:
+        file_in = write_scratch(directory, text)
+        file_out = os.path.join(directory, 'output')
 
-    subprocess.check_call(['extrap-modeler', 'input', file_in, '-o', file_out], timeout=30)
-    model_summary = subprocess.check_output(['extrap-print', file_out]).decode("utf-8")
+        subprocess.check_call(['extrap-modeler', 'input', file_in, '-o', file_out], timeout=30)
+        model_summary = subprocess.check_output(['extrap-print', file_out], timeout=30).decode("utf-8")
 
-    model_str = re.search(r'model: (.+)\n', model_summary).group(1)
-    r2 = re.search(r'Adjusted R\^2: (.+)\n', model_summary).group(1)
+    model_str = parse(r'model: (.+)\n', model_summary, 'extrap-print')
+    r2 = parse(r'Adjusted R\^2: (.+)\n', model_summary, 'extrap-print')
 
     return model_str, float(r2)
 
 
-def extrap_two_param(file_in):
+def extrap_two_param(text):
     """
     Uses extrap to create a two parameter model
-    :param file_in: extrap input
+    :param text: extrap input
     :return: model as string, adj r^2
     """
-    _, file_out = tempfile.mkstemp()
-    subprocess.check_call(['exp_two_param', file_in, file_out], timeout=30)
-    with open(file_out) as csv_file:
-        reader = csv.reader(csv_file, delimiter=',')
-        model_summary = [row for row in reader][1]
+    with tempfile.TemporaryDirectory(dir=scratch_dir) as directory:
+        file_in = write_scratch(directory, text)
+        file_out = os.path.join(directory, 'output.csv')
+
+        subprocess.check_call(['exp_two_param', file_in, file_out], timeout=30)
+        with open(file_out) as csv_file:
+            reader = csv.reader(csv_file, delimiter=',')
+            rows = [row for row in reader]
 
-    model_str = re.search(r'\+ (.+)', model_summary[2]).group(1)
-    r2 = model_summary[4]
+    if len(rows) < 2 or len(rows[1]) < 5:
+        raise FitError('Unexpected output of exp_two_param: %s' % rows)
+    model_str = parse(r'\+ (.+)', rows[1][2], 'exp_two_param')
+    r2 = rows[1][4]
 
     return model_str, float(r2)
 
 
-def create(file, variables, metric, repeat, compare, compare_values, fixed):
+def extrap_in_process(text):
     """
-    Creates a model with extrap
-    :param file: csv file
+    Uses the Extra-P python package to create a model
+    :param text: extrap input
+    :return: model as string, adj r^2
+    """
+    # Extra-P 4 names the measurements of multi parameter models with REGION as well
+    text = re.sub(r'^EXPERIMENT ', 'REGION ', text, flags=re.MULTILINE)
+
+    with tempfile.TemporaryDirectory(dir=scratch_dir) as directory:
+        experiment = TextFileReader().read_experiment(write_scratch(directory, text))
+    generator = ModelGenerator(experiment)
+    generator.model_all()
+    if len(generator.models) == 0:
+        raise FitError('Extra-P created no model')
+    model = next(iter(generator.models.values()))
+
+    return model.hypothesis.function.to_string(*experiment.parameters), float(model.hypothesis.AR2)
+
+
+def run_timed(timeout, fun, *args):
+    """
+    Runs a fit in a worker, stopping it with a TimeoutError after timeout seconds, so a hanging fit does not occupy the
+    worker. Without SIGALRM the fit is not stopped.
+    :param timeout: seconds
+    :param fun: fit function
+    :param args: arguments of the fit function
+    :return: result of the fit function
+    """
+    if not worker_timeouts or threading.current_thread() is not threading.main_thread():
+        return fun(*args)
+
+    def expire(signum, frame):
+        raise TimeoutError('Fit took longer than %s seconds' % timeout)
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return fun(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def submit_timed(fun, *args):
+    """
+    Submits a fit to the worker pool, which stops it after fit_timeout
+    :param fun: fit function
+    :param args: arguments of the fit function
+    :return: future
+    """
+    return get_pool().submit(run_timed, fit_timeout, fun, *args)
+
+
+class TimedPool:
+    """Submits the parts of a fit to the worker pool like an executor, each part is stopped after fit_timeout"""
+
+    def submit(self, fun, *args):
+        return submit_timed(fun, *args)
+
+
+def get_pool():
+    """
+    Returns the worker pool used for fitting, starting it on first use
+    :return: Process pool executor
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=max_workers)
+        return _pool
+
+
+def get_threads():
+    """
+    Returns the thread running fits that submit their parts to the worker pool, starting it on first use
+    :return: Thread pool executor
+    """
+    global _threads
+    with _pool_lock:
+        if _threads is None:
+            _threads = ThreadPoolExecutor(max_workers=1)
+        return _threads
+
+
+@atexit.register
+def shutdown(wait=True):
+    """
+    Stops the worker pool. It is started again by the next fit.
+    :param wait: whether to wait for running fits to complete
+    """
+    global _pool, _threads
+    with _pool_lock:
+        if _threads is not None:
+            _threads.shutdown(wait=wait)
+            _threads = None
+        if _pool is not None:
+            _pool.shutdown(wait=wait)
+            _pool = None
+
+
+def fit_function(n_variables):
+    """
+    Selects how to fit a model
+    :param n_variables: number of variables of the model
+    :return: function fitting an extrap input, identifiers of the modeler version for the fit cache
+    """
+    if n_variables not in (1, 2):
+        raise ValueError("Extra-P supports models with at most 2 parameters, use the native modeler for more")
+    if extrap_api is not None:
+        return extrap_in_process, ('extrap==%s' % extrap_api.__version__,)
+    elif n_variables == 1:
+        return extrap_one_param, one_param_commands
+    else:
+        return extrap_two_param, two_param_commands
+
+
+def submit_fits(texts, n_variables, use_cache=True):
+    """
+    Submits fits of extrap inputs to the worker pool, reusing previous fits of the same input from the fit cache
+    :param texts: extrap inputs as strings
+    :param n_variables: number of variables of the models
+    :param use_cache: whether to look up and store the fits in the fit cache
+    :return: list of futures with the model as string and adj r^2 for each input
+    """
+    fit_fun, commands = fit_function(n_variables)
+
+    futures = []
+    for text in texts:
+        key = fit_key(text, commands) if use_cache else None
+        result = fit_cache.get(key) if use_cache else None
+        if result is not None:
+            future = Future()
+            future.set_result(result)
+        else:
+            future = submit_timed(fit_fun, text)
+            if use_cache:
+                future.add_done_callback(partial(store_fit, key))
+        futures.append(future)
+    return futures
+
+
+def store_fit(key, future):
+    """
+    Stores a completed fit in the fit cache
+    :param key: fit cache key
+    :param future: future of the fit
+    """
+    if not future.cancelled() and future.exception() is None:
+        fit_cache.put(key, *future.result())
+
+
+def run_all(fun, args_list):
+    """
+    Runs a fit function for many arguments in the worker pool
+    :param fun: fit function
+    :param args_list: list of argument tuples
+    :return: list with the result or None if the fit failed for each argument tuple
+    """
+    return collect([submit_timed(fun, *args) for args in args_list])
+
+
+def collect(futures):
+    """
+    Waits for fits
+    :param futures: futures of the fits
+    :return: list with the result or None if the fit failed for each future
+    """
+    results = []
+    try:
+        for future in futures:
+            try:
+                # the workers stop each fit after fit_timeout, waiting here would also count the time in the queue
+                results.append(future.result(timeout=None if worker_timeouts else fit_timeout))
+            except fit_errors:
+                future.cancel()
+                results.append(None)
+    except BrokenProcessPool:
+        shutdown(wait=False)  # a worker died, start a fresh pool for the next fits
+        raise
+    return results
+
+
+def fit_native(grouped, variables, executor=None):
+    """
+    Uses the built-in PMNF modeler to create a model from the mean of the measurements at each point
+    :param grouped: measurements grouped by point
+    :param variables: list of variable names
+    :param executor: executor to search the hypotheses in parallel
+    :return: model as string, adj r^2
+    """
+    offsets = np.asarray(grouped.offsets)
+    means = np.add.reduceat(np.asarray(grouped.metrics, dtype=float), offsets[:-1]) / np.diff(offsets)
+    try:
+        model = pmnf.fit(grouped.points, means, variables, executor=executor)
+    except ValueError as e:  # includes numpy.linalg.LinAlgError
+        raise FitError('PMNF fit failed: %s' % e) from e
+    return model.model_str, model.adj_r2
+
+
+def submit(file, variables, metric, repeat, compare, compare_values, fixed, use_cache=True, modeler='extrap'):
+    """
+    Submits the fits of models without waiting for them
+    :param file: csv file or data frame with its content
     :param variables: list of variable columns
     :param metric: metric column
     :param repeat: repeat column or None
     :param compare: compare column
     :param compare_values: unique values of compare column
     :param fixed: dictionary of column:value to fix
-    :return: Model
+    :param use_cache: whether to reuse fits from the persistent fit cache
+    :param modeler: one of MODELERS; the native modeler also supports more than two variables
+    :return: list of (model name, future with the model as string and adj r^2)
     """
-    def get_model(cmp_dict=None):
-        try:
-            f = fixed.copy()
-            if cmp_dict is not None:
-                f.update(cmp_dict)
-            tmp_file_in = convert(file, variables, metric, repeat, f)
-
-            if len(variables) == 1:
-                return extrap_one_param(tmp_file_in)
-            elif len(variables) == 2:
-                return extrap_two_param(tmp_file_in)
-            else:
-                raise ValueError("Parameters with more than 2 parameters are currently not supported")
-        except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
-            return None
+    if modeler not in MODELERS:
+        raise ValueError('Unknown modeler `%s`. Available: %s' % (modeler, MODELERS))
+
+    # The data is loaded and converted once in this process, the workers only receive the converted measurements
+    data = load(file)
 
     if compare is None:
         # create single model
-        m, r2 = get_model()
-        if m is None:
-            return []
-        return [Model(m, variables, adj_r2=r2)]
+        jobs = [(None, grouped_conversion(data, variables, fixed, metric, repeat))]
     else:
-        # create multiple models
-        def get_model_comp(compare_val):
-            cmp = {compare: compare_val}
-            model_str, adj_r2 = get_model(cmp)
-            if model_str is None:
-                return None
-            return Model(model_str, variables, name=compare_val, adj_r2=adj_r2)
-
-        with Pool(multiprocessing.cpu_count()) as p:
-            models = p.map(get_model_comp, compare_values)
-            return list(filter(lambda x: x is not None, models))
+        # create multiple models, compare values without measurements are skipped
+        grouped = grouped_conversion_by(data, variables, fixed, metric, repeat, compare)
+        jobs = [(compare_val, grouped[compare_val]) for compare_val in compare_values if compare_val in grouped]
+
+    if modeler == 'native' and len(variables) > 2:
+        # one model after another, but the hypotheses of each model are searched in parallel
+        futures = [get_threads().submit(fit_native, g, variables, TimedPool()) for _, g in jobs]
+    elif modeler == 'native':
+        futures = [submit_timed(fit_native, g, variables) for _, g in jobs]
+    else:
+        futures = submit_fits([write_input(g, variables, metric) for _, g in jobs], len(variables), use_cache)
+    return [(name, future) for (name, _), future in zip(jobs, futures)]
+
+
+def create(file, variables, metric, repeat, compare, compare_values, fixed, use_cache=True, modeler='extrap'):
+    """
+    Creates a model with extrap
+    :param file: csv file or data frame with its content
+    :param variables: list of variable columns
+    :param metric: metric column
+    :param repeat: repeat column or None
+    :param compare: compare column
+    :param compare_values: unique values of compare column
+    :param fixed: dictionary of column:value to fix
+    :param use_cache: whether to reuse fits from the persistent fit cache
+    :param modeler: one of MODELERS; the native modeler also supports more than two variables
+    :return: Model
+    """
+    jobs = submit(file, variables, metric, repeat, compare, compare_values, fixed, use_cache, modeler)
+    return models_of(jobs, collect([future for _, future in jobs]), variables)
+
+
+def models_of(jobs, results, variables):
+    """
+    Creates the models of completed fits
+    :param jobs: list of (model name, future) as returned by submit
+    :param results: results of the futures as returned by collect
+    :param variables: list of variable columns
+    :return: list of models, failed fits are skipped
+    """
+    return [Model(result[0], variables, name=name, adj_r2=result[1])
+            for (name, _), result in zip(jobs, results) if result is not None]
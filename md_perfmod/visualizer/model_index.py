@@ -0,0 +1,334 @@
+"""Precomputes the models of all selections of the dashboard"""
+import argparse
+import json
+import os
+import warnings
+from collections import deque, namedtuple
+from itertools import product
+
+from md_perfmod import csv2store
+from md_perfmod.models import comparison
+from md_perfmod.visualizer import model_creation
+from md_perfmod.visualizer.filter_index import FilterIndex
+from md_perfmod.visualizer.model_store import selection_key
+
+# Selections whose fits are submitted to the worker pool at the same time
+max_pending = 4 * model_creation.max_workers
+
+Parameters = namedtuple('Parameters', 'file_in file_out metrics compare repeat max_variables modeler use_cache')
+
+
+def read_params():
+    """
+    Reads and processes the program arguments and returns them as a named tuple.
+    :return: Named parameter tuple
+    """
+
+    parser = argparse.ArgumentParser(description='Fits the models of all selections the dashboard offers for a result '
+                                                 'file and writes them to a model index loaded by the dashboard',
+                                     epilog='Example of use: python model_index.py data.csv -m time -r repeat')
+
+    parser.add_argument('file_in', help="Input file [csv, parquet, feather]")
+    parser.add_argument('file_out', nargs='?', default='',
+                        help='Model index file (will be overwritten) [default: FILE_IN.models.json, which the '
+                             'dashboard loads automatically]')
+    parser.add_argument('-m', '--metrics', nargs='+', default=None,
+                        help='Metric columns to create models for [default: all metric columns]')
+    parser.add_argument('-c', '--compare', nargs='+', default=None,
+                        help='Compare columns to create models for, `none` for models without compare column '
+                             '[default: none and all selectable columns]')
+    parser.add_argument('-r', '--repeat', default=None,
+                        help='Repeat column as selected in the dashboard [default: no repeat column]')
+    parser.add_argument('--max-variables', type=int, choices=(1, 2), default=2,
+                        help='Create models of up to this many variables [default: %(default)s]')
+    parser.add_argument('--modeler', choices=model_creation.MODELERS, default='extrap',
+                        help='Modeler to use [default: %(default)s]')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always fit the models instead of reusing cached fits')
+
+    args = parser.parse_args()
+
+    file_out = args.file_out
+    if file_out == '' or file_out.isspace():
+        file_out = default_index_file(args.file_in)
+
+    compare = None
+    if args.compare is not None:
+        compare = [None if c.lower() == 'none' else c for c in args.compare]
+
+    params = Parameters(args.file_in, file_out, args.metrics, compare, args.repeat, args.max_variables, args.modeler,
+                        not args.no_cache)
+
+    print(params)
+
+    return params
+
+
+def default_index_file(file_in):
+    """
+    :param file_in: Result file
+    :return: Model index file the dashboard loads for the result file
+    """
+    return file_in + '.models.json'
+
+
+def classify_columns(data):
+    """
+    Splits the columns into columns selectable as variables (few distinct values) and metric columns
+    :param data: Data frame
+    :return: selectable columns, unique values of each selectable column, metric columns
+    """
+    selectable_columns = []
+    selectable_columns_values = []
+    metric_columns = []
+
+    for c in data.columns:
+        unique_val = data[c].unique()
+        if 1 < len(unique_val) < len(data) / 4:
+            selectable_columns.append(c)
+            selectable_columns_values.append(unique_val)
+        elif 1 < len(unique_val):
+            metric_columns.append(c)
+
+    return selectable_columns, selectable_columns_values, metric_columns
+
+
+def slider_values(values):
+    """
+    Values a slider of a column can take, text columns are selected by negative positions
+    :param values: Unique values of the column
+    :return: List of slider values
+    """
+    if isinstance(values[0], str):
+        return list(range(-len(values), 0))
+    return [v.item() if hasattr(v, 'item') else v for v in values]
+
+
+def canonical_selection(selection, selectable_columns):
+    """
+    Removes the values of sliders that do not influence the models, i.e. of the selected columns. Whole numbers are
+    converted to int, as the dashboard sends 4.0 as 4.
+    :param selection: sel_var1, sel_var2, sel_metric, sel_compare, sel_repeat, slider values
+    :param selectable_columns: Columns of the sliders
+    :return: Selection with None for ignored slider values
+    """
+    def normalize(v):
+        return int(v) if isinstance(v, float) and v.is_integer() else v
+
+    selected = list(selection[:5])
+    sliders = [None if col in selected else normalize(v) for col, v in zip(selectable_columns, selection[5:])]
+    return selected + sliders
+
+
+def index_key(kind, selection, selectable_columns):
+    """
+    :param kind: 'models' or 'combined'
+    :param selection: Selected values
+    :param selectable_columns: Columns of the sliders
+    :return: Key of the selection in the model index
+    """
+    return selection_key(kind, *canonical_selection(selection, selectable_columns))
+
+
+def model_request(selection, selectable_columns, filter_index):
+    """
+    Converts a selection to the arguments of model_creation.create
+    :param selection: sel_var1, sel_var2, sel_metric, sel_compare, sel_repeat, slider values
+    :param selectable_columns: Columns of the sliders
+    :param filter_index: FilterIndex of the data to resolve slider values
+    :return: variables, metric, repeat, compare, compare values, fixed values
+    """
+    sel_var1, sel_var2, sel_metric, sel_compare, sel_repeat = selection[:5]
+
+    if sel_compare is None:
+        comp_values = None
+    else:
+        comp_values = filter_index.uniques[sel_compare]
+
+    fixed = dict(
+        filter(lambda s: s[0] not in [sel_var1, sel_var2, sel_metric, sel_compare, sel_repeat],
+               zip(selectable_columns, selection[5:])))
+
+    for k, v in fixed.items():
+        fixed[k] = filter_index.resolve(k, v)
+
+    variables = [sel_var1]
+    if sel_var2 is not None:
+        variables.append(sel_var2)
+
+    return variables, sel_metric, sel_repeat, sel_compare, comp_values, fixed
+
+
+def mid_val(ll):  # similar to median, when even number of values takes the larger 'middle' value
+    sl = sorted(ll)
+    item = None
+    while len(sl) >= 2:
+        item = sl.pop()
+        sl.pop(0)
+    if len(sl) == 1:
+        return sl[0]
+    else:
+        return item
+
+
+def combined_selections(selection, selectable_columns, selectable_columns_values):
+    """
+    Selections of the one dimensional models combined into the models of a two variable selection. The other variable
+    is fixed at its middle value.
+    :param selection: sel_var1, sel_var2, sel_metric, sel_compare, sel_repeat, slider values
+    :param selectable_columns: Columns of the sliders
+    :param selectable_columns_values: Unique values of the slider columns
+    :return: Selection for sel_var1, selection for sel_var2
+    """
+    sel_var1, sel_var2, sel_metric, sel_compare, sel_repeat = selection[:5]
+    variables = [sel_var1, sel_var2]
+
+    def one_d_selection(variable, other):
+        fixed = list(selection[5:])
+        col_ix = selectable_columns.index(other)
+        fixed[col_ix] = mid_val(selectable_columns_values[col_ix])
+        return [variable, None, sel_metric, sel_compare, sel_repeat] + fixed
+
+    return [one_d_selection(v, [x for x in variables if x != v][0]) for v in variables]
+
+
+def combine_all(single_models):
+    """
+    Combines the models of both variables with the same name
+    :param single_models: Models of the first variable, models of the second variable
+    :return: List of combined models
+    """
+    return list(map(lambda m: comparison.combine(*m, combined_name=m[0].name), zip(*single_models)))
+
+
+def selections(selectable_columns, selectable_columns_values, metric_columns, metrics=None, compare=None, repeat=None,
+               max_variables=2):
+    """
+    Enumerates the selections of the dashboard. Sliders of selected columns are ignored and text columns can only be
+    compared, not modelled.
+    :param selectable_columns: Columns of the sliders
+    :param selectable_columns_values: Unique values of the slider columns
+    :param metric_columns: Metric columns
+    :param metrics: Metric columns to enumerate [default: all]
+    :param compare: Compare columns to enumerate, None for no compare column [default: None and all]
+    :param repeat: Repeat column
+    :param max_variables: Maximum number of variables
+    :return: Generator of canonical selections
+    """
+    metrics = metric_columns if metrics is None else metrics
+    compare = [None] + list(selectable_columns) if compare is None else compare
+    columns = [c for c, values in zip(selectable_columns, selectable_columns_values)
+               if c != repeat and not isinstance(values[0], str)]
+    var2_choices = [None] + columns if max_variables > 1 else [None]
+
+    for sel_var1, sel_var2, sel_metric, sel_compare in product(columns, var2_choices, metrics, compare):
+        if sel_var1 == sel_var2 or (sel_compare is not None and sel_compare in (sel_var1, sel_var2, repeat)):
+            continue
+        selected = [sel_var1, sel_var2, sel_metric, sel_compare, repeat]
+        slider_choices = [[None] if col in selected else slider_values(values)
+                          for col, values in zip(selectable_columns, selectable_columns_values)]
+        for sliders in product(*slider_choices):
+            yield selected + list(sliders)
+
+
+def precompute(data, selection_list, modeler='extrap', use_cache=True):
+    """
+    Fits the models of many selections in the worker pool
+    :param data: Data frame
+    :param selection_list: Selections as generated by selections
+    :param modeler: One of model_creation.MODELERS
+    :param use_cache: Whether to reuse fits from the persistent fit cache
+    :return: Dict of index key: list of serialized models
+    """
+    selectable_columns, selectable_columns_values, _ = classify_columns(data)
+    filter_index = FilterIndex(data, selectable_columns)
+
+    two_d = [s for s in selection_list if s[1] is not None]
+    one_d = [s for s in selection_list if s[1] is None]
+    for s in two_d:
+        one_d += combined_selections(s, selectable_columns, selectable_columns_values)
+
+    requests = {}
+    for s in one_d + two_d:
+        requests.setdefault(index_key('models', s, selectable_columns), s)
+    print('Fitting %d selections' % len(requests))
+
+    models = {}
+    pending = deque()
+
+    def collect_oldest():
+        key, variables, tasks = pending.popleft()
+        models[key] = model_creation.models_of(tasks, model_creation.collect([f for _, f in tasks]), variables)
+        if len(models) % 100 == 0:
+            print('Fitted %d of %d selections' % (len(models), len(requests)))
+
+    # the next selections are submitted while the oldest are collected, so the fits run on all cores while only the
+    # data of max_pending selections waits in memory
+    for key, s in requests.items():
+        if len(pending) >= max_pending:
+            collect_oldest()
+        request = model_request(s, selectable_columns, filter_index)
+        pending.append((key, request[0], model_creation.submit(data, *request, use_cache=use_cache, modeler=modeler)))
+    while pending:
+        collect_oldest()
+
+    for s in two_d:
+        single_models = [models[index_key('models', one, selectable_columns)]
+                         for one in combined_selections(s, selectable_columns, selectable_columns_values)]
+        models[index_key('combined', s, selectable_columns)] = combine_all(single_models)
+
+    return dict((key, [m.serializable() for m in model_list]) for key, model_list in models.items())
+
+
+def data_version(file):
+    """
+    :param file: Result file
+    :return: Size and modification time of the file
+    """
+    stat = os.stat(file)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def write_index(file_out, entries, file_in=None, modeler=None):
+    data = None if file_in is None else data_version(file_in)
+    with open(file_out, 'w') as file:
+        # model names are the values of the compare column, which may be numpy scalars
+        json.dump({'file': file_in, 'data': data, 'modeler': modeler, 'entries': entries}, file,
+                  default=lambda o: o.item())
+
+
+def load_index(file, data_file=None):
+    """
+    Loads a model index
+    :param file: Model index file
+    :param data_file: Result file the models are used for. The index is ignored with a warning if it was not created
+    from this version of the file.
+    :return: Dict of index key: list of serialized models or an empty dict if there is no matching index
+    """
+    if not os.path.exists(file):
+        return {}
+    with open(file) as f:
+        index = json.load(f)
+    if data_file is not None and index.get('data') != data_version(data_file):
+        warnings.warn('Ignoring the model index %s, it was created from another version of %s. Run perfmod-index to '
+                      'create it again.' % (file, data_file))
+        return {}
+    return index['entries']
+
+
+def main():
+    params = read_params()
+
+    data = csv2store.load(params.file_in)
+    selectable_columns, selectable_columns_values, metric_columns = classify_columns(data)
+    selection_list = list(selections(selectable_columns, selectable_columns_values, metric_columns, params.metrics,
+                                     params.compare, params.repeat, params.max_variables))
+
+    entries = precompute(data, selection_list, params.modeler, params.use_cache)
+    write_index(params.file_out, entries, params.file_in, params.modeler)
+
+    print('Wrote %d selections to %s' % (len(entries), params.file_out))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Server-side storage for the models shown in the dashboard"""
+import json
+import threading
+from collections import OrderedDict
+
+default_max_entries = 256
+
+
+def _plain(value):
+    # numpy scalars are converted to the corresponding python numbers
+    return value.item() if hasattr(value, 'item') else str(value)
+
+
+def selection_key(kind, *selection):
+    """
+    Creates the key of a model selection. The key contains the selection itself, so the models can be created again
+    from the key alone if they are no longer stored.
+    :param kind: Kind of the models, e.g. 'models' or 'combined'
+    :param selection: Selected values (variables, metric, ..., slider values)
+    :return: Key as JSON string
+    """
+    return json.dumps([kind, list(selection)], default=_plain, separators=(',', ':'))
+
+
+def parse_key(key):
+    """
+    Restores the selection from a key
+    :param key: Key created by selection_key
+    :return: kind, list of selected values
+    """
+    kind, selection = json.loads(key)
+    return kind, selection
+
+
+class ModelStore:
+    def __init__(self, max_entries=default_max_entries):
+        """
+        Thread-safe store of model lists by selection key, evicting the least recently used entries
+        :param max_entries: Maximum number of stored model lists
+        """
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Looks up models
+        :param key: Selection key
+        :return: List of models or None if they are not stored
+        """
+        with self.lock:
+            models = self.entries.get(key)
+            if models is not None:
+                self.entries.move_to_end(key)  # mark as recently used
+            return models
+
+    def put(self, key, models):
+        """
+        Stores models and evicts the least recently used entries if the store is full
+        :param key: Selection key
+        :param models: List of models
+        """
+        with self.lock:
+            self.entries[key] = list(models)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_or_create(self, key, create):
+        """
+        Looks up models and creates them if they are not stored
+        :param key: Selection key
+        :param create: Function creating the models from the kind and the selected values of the key
+        :return: List of models
+        """
+        models = self.get(key)
+        if models is None:
+            models = create(*parse_key(key))
+            self.put(key, models)
+        return models
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
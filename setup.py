@@ -14,6 +14,8 @@ setup(
         'console_scripts': [
             'csv2extrap = md_perfmod.csv2extrap:main',
             'csv2model = md_perfmod.csv2model:main',
+            'csv2store = md_perfmod.csv2store:main',
+            'perfmod-index = md_perfmod.visualizer.model_index:main',
         ],
     },
 )
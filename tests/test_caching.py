@@ -0,0 +1,66 @@
+import flask
+import pytest
+
+from md_perfmod.csv2store import fingerprint
+from md_perfmod.visualizer.caching import ResultCache, cache_config
+
+
+def test_cache_config():
+    config = cache_config({'MD_PERFMOD_CACHE_TYPE': 'redis', 'MD_PERFMOD_CACHE_TTL': '60'})
+    assert config['CACHE_TYPE'] == 'redis' and config['CACHE_DEFAULT_TIMEOUT'] == 60
+    assert config['CACHE_REDIS_URL'].startswith('redis://')
+    with pytest.raises(ValueError):
+        cache_config({'MD_PERFMOD_CACHE_TYPE': 'unknown'})
+
+
+def test_memoize_shared(tmp_path):
+    config = cache_config({'MD_PERFMOD_DASH_CACHE_DIR': str(tmp_path)})
+    calls = []
+
+    def create(server):
+        cache = ResultCache(server, config)
+
+        @cache.memoize()
+        def f(a, b):
+            calls.append((a, b))
+            return None if a is None else [a, b]
+
+        return cache, f
+
+    cache, f = create(flask.Flask('a'))
+    assert f(1, 'x') == [1, 'x'] and f(1, 'x') == [1, 'x']
+    assert f(None, 'x') is None and f(None, 'x') is None
+    assert len(calls) == 2
+
+    # a second server, e.g. another worker, uses the same entries
+    other, g = create(flask.Flask('b'))
+    assert g(1, 'x') == [1, 'x'] and len(calls) == 2
+
+    stats = cache.stats.summary()
+    assert list(stats.values()) == [{'hits': 2, 'misses': 2, 'hit_rate': 0.5}]
+    with other.cache.app.test_client() as client:
+        assert list(client.get('/cache-stats').get_json()['functions'].values())[0]['hits'] == 1
+
+
+def test_changed_data_misses(tmp_path):
+    config = cache_config({'MD_PERFMOD_DASH_CACHE_DIR': str(tmp_path / 'cache')})
+    data = tmp_path / 'data.csv'
+    data.write_text('p,time\n1,1.0\n')
+    calls = []
+
+    def create(name):
+        cache = ResultCache(flask.Flask(name), config, stats_route=None, fingerprint=fingerprint(str(data)))
+
+        @cache.memoize()
+        def f(a):
+            calls.append(a)
+            return a
+
+        return f
+
+    f = create('a')
+    assert f(1) == 1 and create('b')(1) == 1 and len(calls) == 1
+
+    # the result file is regenerated
+    data.write_text('p,time\n1,1.0\n2,2.0\n')
+    assert create('c')(1) == 1 and len(calls) == 2
@@ -1,3 +1,4 @@
+import io
 from inspect import signature
 from itertools import product, starmap
 
@@ -122,3 +123,60 @@ class TestConversion(object):
         assert result[(1,)] == [11220]
         assert result[(2,)] == [21220]
         assert result[(3,)] == [31220]
+
+    def test_conversion_by(self):
+        df = self.df_large.copy(deep=True)
+        result = cv.conversion_by(df, ['p'], {'s': 2}, 'metric_a', None, 'q')
+        assert sorted(result.keys()) == [1, 2, 3]
+        for q in (1, 2, 3):
+            assert result[q] == cv.conversion(df, ['p'], {'s': 2, 'q': q}, 'metric_a', None)
+
+    def test_conversion_by_repeat(self):
+        df = pd.DataFrame(np.array([[1, 1, 11, 1], [1, 1, 10, 0], [2, 1, 20, 0], [1, 2, 30, 0]]),
+                          columns=['p', 'c', 'time', 'repeat'])
+        result = cv.conversion_by(df, ['p'], {}, 'time', 'repeat', 'c')
+        assert result[1] == {(1,): [10, 11], (2,): [20]}
+        assert result[2] == {(1,): [30]}
+
+    def test_conversion_by_compare_fixed(self):
+        df = self.df_complex.copy(deep=True)
+        with pytest.raises(ValueError):
+            cv.conversion_by(df, ['p'], {'q': 2}, 'time', 'repeat', 'q')
+
+    def test_write_grouped(self):
+        df = self.df_repeat.copy(deep=True)
+        grouped = cv.grouped_conversion(df, ['p'], {}, 'time', 'repeat')
+        params = cv.Parameters(['p'], {}, 'time', 'repeat', None, None, 'exp', None)
+        file = io.StringIO()
+        cv.write_extrap_grouped(file, grouped, params)
+        assert file.getvalue() == 'PARAMETER p\nPOINTS 1 2 3\nMETRIC time\nREGION exp\n' \
+                                  'DATA 10 11\nDATA 20 21\nDATA 30 31\n'
+
+    def test_write_grouped_float_metric(self):
+        df = self.df_repeat.astype({'time': float})
+        grouped = cv.grouped_conversion(df, ['p'], {}, 'time', 'repeat')
+        params = cv.Parameters(['p'], {}, 'time', 'repeat', None, None, 'exp', None)
+        file = io.StringIO()
+        cv.write_extrap_grouped(file, grouped, params)
+        # same output as converting the rows of the variables and the metric
+        assert file.getvalue() == 'PARAMETER p\nPOINTS 1.0 2.0 3.0\nMETRIC time\nREGION exp\n' \
+                                  'DATA 10.0 11.0\nDATA 20.0 21.0\nDATA 30.0 31.0\n'
+
+    def test_read_selected(self, tmp_path):
+        path = str(tmp_path / 'data.csv')
+        self.df_large.to_csv(path, index=False)
+        fixed = {'q': 3, 'r': 2, 's': 2}
+        data = cv.read_selected(path, ['p', 'metric_a'], fixed, chunksize=7)
+        assert list(data.columns) == ['p', 'metric_a', 'q', 'r', 's']
+        assert len(data) == 3
+        assert cv.conversion(data, ['p'], fixed, 'metric_a', None) == \
+            cv.conversion(self.df_large, ['p'], fixed, 'metric_a', None)
+
+    def test_read_selected_empty(self, tmp_path):
+        path = str(tmp_path / 'data.csv')
+        self.df_large.iloc[:0].to_csv(path, index=False)
+        data = cv.read_selected(path, ['p', 'metric_a'], {'q': 3}, chunksize=7)
+        assert list(data.columns) == ['p', 'metric_a', 'q'] and len(data) == 0
+
+        self.df_large.to_csv(path, index=False)
+        assert len(cv.read_selected(path, ['p', 'metric_a'], {'q': -1}, chunksize=7)) == 0
@@ -0,0 +1,93 @@
+import json
+import sys
+from itertools import product
+
+import pandas as pd
+import pytest
+
+from md_perfmod import csv2model
+
+
+def make_data():
+    rows = [(t, p, q, r, (2 if t == 'a' else 3) * p ** 2 * q + 0.01 * r)
+            for t, p, q, r in product(['a', 'b'], [1, 2, 4, 8, 16], [1, 2, 3], range(2))]
+    return pd.DataFrame(rows, columns=['t', 'p', 'q', 'repeat', 'time'])
+
+
+def params(spec=None, file_in=None, file_out='', chunksize=None, **kwargs):
+    args = dict(vars=None, fixed={}, metric='time', compare=None, repeat='repeat')
+    args.update(kwargs)
+    return csv2model.Parameters(file_in=file_in, file_out=file_out, use_cache=False, chunksize=chunksize,
+                                modeler='native', spec=spec, workers=None, **args)
+
+
+def write_spec(tmp_path, spec, name='spec.json'):
+    path = str(tmp_path / name)
+    with open(path, 'w') as file:
+        json.dump(spec, file)
+    return path
+
+
+def test_spec_defaults(tmp_path):
+    spec = write_spec(tmp_path, {'metric': 'other', 'fixed': {'q': 1, 't': 'a'},
+                                 'jobs': [{'name': 'p', 'vars': 'p', 'fixed': {'q': 2}},
+                                          {'vars': ['q'], 'metric': 'time', 'compare': 't'}]})
+    jobs = csv2model.batch_jobs(params(spec, fixed={'x': '3', 'q': '5'}, compare='c'))
+    # job values take precedence over the top level values of the file, which take precedence over the arguments
+    assert jobs[0] == csv2model.Job('p', ['p'], {'x': '3', 'q': 2, 't': 'a'}, 'other', 'c', 'repeat')
+    assert jobs[1] == csv2model.Job('job1', ['q'], {'x': '3', 'q': 1, 't': 'a'}, 'time', 't', 'repeat')
+
+    # a list of jobs without defaults
+    spec = write_spec(tmp_path, [{'vars': ['p']}, {'vars': ['q']}])
+    assert [job.name for job in csv2model.batch_jobs(params(spec))] == ['job0', 'job1']
+
+    assert csv2model.batch_jobs(params(vars=['p'])) == [csv2model.Job(None, ['p'], {}, 'time', None, 'repeat')]
+
+
+def test_invalid_spec(tmp_path):
+    spec = write_spec(tmp_path, [{'name': 'a', 'vars': ['p']}, {'name': 'a', 'vars': ['q']}])
+    with pytest.raises(ValueError, match='unique'):
+        csv2model.batch_jobs(params(spec))
+
+    spec = write_spec(tmp_path, [{'name': 'a', 'vars': ['p']}, {'name': 'no_vars'}])
+    with pytest.raises(ValueError, match='no_vars'):
+        csv2model.batch_jobs(params(spec))
+
+
+def test_yaml_spec_needs_pyyaml(tmp_path, monkeypatch):
+    path = str(tmp_path / 'spec.yaml')
+    with open(path, 'w') as file:
+        file.write('- vars: [p]\n')
+    monkeypatch.setitem(sys.modules, 'yaml', None)
+    with pytest.raises(ImportError, match='PyYAML'):
+        csv2model.read_spec(path)
+
+
+def test_read_data_once(tmp_path):
+    path = str(tmp_path / 'data.csv')
+    make_data().to_csv(path, index=False)
+    jobs = [csv2model.Job('p', ['p'], {'q': 1, 't': 'a'}, 'time', None, 'repeat'),
+            csv2model.Job('q', ['q'], {'p': 2, 't': 'a'}, 'time', None, 'repeat')]
+
+    data = csv2model.read_data(params(file_in=path, chunksize=7), jobs)
+    # only the value fixed by both jobs is filtered while reading, the columns of all jobs are read
+    assert set(data['t']) == {'a'} and len(data) == 30
+    assert set(data.columns) == {'p', 'q', 't', 'repeat', 'time'}
+
+    assert len(csv2model.read_data(params(file_in=path), jobs)) == 60
+
+
+def test_batch_output(tmp_path, monkeypatch):
+    data = str(tmp_path / 'data.csv')
+    make_data().to_csv(data, index=False)
+    spec = write_spec(tmp_path, {'fixed': {'q': 1}, 'jobs': [{'name': 'p-a', 'vars': ['p'], 'fixed': {'t': 'a'}},
+                                                             {'name': 'p', 'vars': ['p'], 'compare': 't'}]})
+    out = str(tmp_path / 'models.json')
+    monkeypatch.setattr(sys, 'argv', ['csv2model.py', data, out, '--spec', spec, '--modeler', 'native', '--no-cache'])
+    csv2model.main()
+
+    with open(out) as file:
+        models = json.load(file)
+    assert list(models) == ['p-a', 'p']
+    assert [m['identifier'] for m in models['p']] == ['a', 'b']
+    assert models['p-a'][0]['variables'] == ['p'] and models['p-a'][0]['model'] == models['p'][0]['model']
@@ -0,0 +1,26 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from md_perfmod.visualizer.filter_index import FilterIndex
+
+
+def test_select_matches_masks():
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame({'a': rng.integers(0, 4, 500), 'b': rng.choice(['x', 'y', 'z'], 500),
+                         'c': rng.choice([0.5, 1.5], 500)})
+    data['b'] = data['b'].astype('category')
+    index = FilterIndex(data, ['a', 'b', 'c'])
+
+    for a, b, c in itertools.product([0, 3, 7], [-3, -1], [0.5, 1.5]):
+        expected = data
+        for col, val in [('a', a), ('b', b), ('c', c)]:
+            if val < 0:
+                val = data[col].unique()[val + len(data[col].unique())]
+            expected = expected[expected[col] == val]
+        result = index.select(data, {'a': a, 'b': b, 'c': c})
+        assert result.index.tolist() == expected.index.tolist()
+
+    assert index.select(data, {}) is data
+    assert index.resolve('b', -1) == data['b'].unique()[-1]
@@ -0,0 +1,35 @@
+import os
+
+from md_perfmod.visualizer.fit_cache import FitCache, fit_key
+
+
+def test_put_get(tmp_path):
+    cache = FitCache(str(tmp_path))
+    key = fit_key('PARAMETER p\n', ['extrap-modeler'])
+    assert cache.get(key) is None
+    cache.put(key, '1 + 2 * p', 0.9)
+    assert cache.get(key) == ('1 + 2 * p', 0.9)
+
+
+def test_key_depends_on_input_and_command():
+    assert fit_key('a', ['extrap-modeler']) != fit_key('b', ['extrap-modeler'])
+    assert fit_key('a', ['extrap-modeler']) != fit_key('a', ['exp_two_param'])
+
+
+def test_lru_eviction(tmp_path):
+    cache = FitCache(str(tmp_path), max_entries=2)
+    cache.put('a', 'a', 1.0)
+    cache.put('b', 'b', 1.0)
+    os.utime(os.path.join(str(tmp_path), 'a.json'), (0, 0))
+    os.utime(os.path.join(str(tmp_path), 'b.json'), (1, 1))
+    cache.get('a')  # a is now the most recently used entry
+    cache.put('c', 'c', 1.0)
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+
+
+def test_clear(tmp_path):
+    cache = FitCache(str(tmp_path))
+    cache.put('a', 'a', 1.0)
+    cache.clear()
+    assert cache.get('a') is None
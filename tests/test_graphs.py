@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+from md_perfmod.models.model import Model
+from md_perfmod.visualizer import graphs
+
+
+def test_data_options():
+    data = pd.DataFrame({'x': [1, 1, 1, 2, 2, 4], 'y': [1.0, 2.0, 6.0, 3.0, 3.0, 5.0]})
+
+    raw = graphs.data_options(data, ['x'], 'y')
+    assert list(raw['y']) == list(data['y'])
+
+    mean = graphs.data_options(data, ['x'], 'y', 'mean')
+    assert list(mean['x']) == [1, 2, 4] and np.allclose(mean['y'], [3, 3, 5])
+    assert np.allclose(mean['error_y']['array'], [1.96 * np.sqrt(7 / 3), 0, 0])
+
+    median = graphs.data_options(data, ['x'], 'y', 'median')
+    assert np.allclose(median['y'], [2, 3, 5])
+    assert np.allclose(median['error_y']['arrayminus'], [1, 0, 0])
+    assert np.allclose(median['error_y']['array'], [4, 0, 0])
+
+    assert len(graphs.data_options(data, ['x'], 'y', budget=4)['x']) == 4
+    assert len(graphs.data_options(data, ['x'], 'y', 'mean', budget=2)['x']) == 2
+
+
+def test_create_mesh():
+    x = [np.array([1.0, 2.0, 3.0]), np.array([1.0, 2.0])]
+    samples = x[0][:, None] + 10 * x[1][None, :]
+    options = dict(name='model', mode='lines', line=dict(color='#1f77b4', width=3))
+
+    wireframe, = graphs.create_mesh(x, samples, options)
+    points = np.stack([wireframe.x, wireframe.y, wireframe.z], axis=1)
+    lines = np.split(points, np.flatnonzero(np.isnan(points[:, 0])) + 1)
+    lines = [line[~np.isnan(line[:, 0])] for line in lines if not np.all(np.isnan(line))]
+    assert len(lines) == 2 + 3  # one line per value of each variable
+    for line in lines:
+        assert np.allclose(line[:, 2], line[:, 0] + 10 * line[:, 1])
+
+    surface, = graphs.create_mesh(x, samples, options, 'surface', opacity=0.5)
+    assert np.allclose(surface.z, samples.T) and surface.opacity == 0.5
+    assert surface.colorscale == ((0, '#1f77b4'), (1, '#1f77b4'))
+
+
+def test_sample_cache():
+    a = Model('2 * x', ['x'], 'a')
+    x, samples = graphs.sample(a, [(np.int64(1), 4)], n=5)
+    assert np.allclose(samples, 2 * x[0]) and not samples.flags.writeable
+    assert graphs.sample(Model('2 * x', ['x'], 'b'), [(1.0, 4.0)], n=5)[1] is samples
+
+
+def test_traces():
+    models = [Model('x', ['x'], 'a'), Model('2 * x', ['x'], 'b')]
+    data = pd.DataFrame({'x': [1, 2, 1], 'y': [1.0, 2.0, 3.0], 'c': ['a', 'a', 'c']})
+
+    assert len(graphs.model_traces(models, [(1, 2)], 'c')) == 2
+    assert [t.name for t in graphs.model_traces(models, [(1, 2)], 'c', indices=[1])] == ['c: b (model)']
+
+    traces = graphs.data_traces(models, data, ['x'], 'y', 'c')
+    assert [len(t.x) for t in traces] == [2, 0]  # one trace per model, no measurements for b
+
+    models = [Model('x * y', ['x', 'y'], 'a'), Model('2 * x * y', ['x', 'y'], 'b')]
+    traces = graphs.model_traces(models, [(1, 2), (1, 2)], 'c', 'surface', opacities={'b': 0.3})
+    assert [t.opacity for t in traces] == [graphs.mesh_opacity, 0.3]
@@ -0,0 +1,33 @@
+import math
+
+import pytest
+
+from md_perfmod.models import integration
+from md_perfmod.models.model import Model
+
+
+def test_closed_form_matches_quadrature():
+    cases = [('4.2 + 1.5 * x^1.5 * log2^2(x)', [(1, 64)]),
+             ('x^-1 * log2^2(x)', [(1, 10)]),
+             ('2 * x^2 - x', [(-3, 2)]),
+             ('3 + 2 * x^0.5 * y^2 + -1.5 * log2(y)', [(1, 64), (2, 32)]),
+             ('(2 * log2(x))*(0.5 + y^(1/3))', [(0, 64), (1, 32)])]
+    for expression, bounds in cases:
+        m = Model(expression, ['x', 'y'][:len(bounds)])
+        assert integration.pmnf_terms(m.model_str, tuple(m.variables)) is not None
+        value, error = m.quad(*bounds, method='analytic')
+        expected, expected_error = m.quad(*bounds, method='adaptive')
+        assert math.isclose(value, expected, rel_tol=1e-9)
+        assert error <= expected_error
+
+
+def test_fallback():
+    m = Model('max(x, 2)', ['x'])
+    with pytest.raises(integration.NotClosedForm):
+        m.quad((0, 4), method='analytic')
+    value, error = m.quad((0, 4))
+    assert math.isclose(value, 10) and error < 1e-6
+
+    # diverges at 0 in closed form
+    with pytest.raises(integration.NotClosedForm):
+        Model('1 / x', ['x']).quad((0, 1), method='analytic')
@@ -0,0 +1,53 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from md_perfmod.models.model import Model
+from md_perfmod.visualizer.jobs import FitJob, JobManager
+
+
+def to_models(name, result):
+    return [Model(result[0], ['x'], name=name, adj_r2=result[1])]
+
+
+def test_fit_job_progress():
+    release = threading.Event()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        failed = Future()
+        failed.set_exception(RuntimeError('fit failed'))
+        tasks = [('a', executor.submit(lambda: ('2 * x', 0.9))),
+                 ('b', executor.submit(lambda: release.wait() and ('x', 0.5))),
+                 ('c', failed)]
+        job = FitJob(tasks, to_models)
+        tasks[0][1].result()
+        assert not job.done()
+        assert [m.name for m in job.models()] == ['a']  # completed models are available while the others run
+        release.set()
+        tasks[1][1].result()
+    assert job.done() and job.progress() == (3, 1, 3)
+    assert [m.name for m in job.models()] == ['a', 'b']
+
+
+def test_job_manager():
+    jobs = JobManager()
+    pending = Future()
+    submitted = []
+
+    def submit():
+        submitted.append(1)
+        return FitJob([('a', pending)], to_models)
+
+    job = jobs.start('key', submit)
+    assert jobs.start('key', submit) is job and len(submitted) == 1
+
+    jobs.cancel('key')
+    assert pending.cancelled() and jobs.get('key') is None and job.progress() == (1, 1, 1)
+    assert jobs.start('key', submit) is not job and len(submitted) == 2
+
+
+def test_fit_job_timeout():
+    running = Future()
+    job = FitJob([('a', running)], to_models, timeout=0.01)
+    time.sleep(0.02)
+    assert job.expired() and job.done() and job.progress() == (1, 1, 1)
+    assert job.models() == []
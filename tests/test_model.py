@@ -1,4 +1,9 @@
 import math
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
 
 from md_perfmod.models import model
 
@@ -45,3 +50,72 @@ def test_integrate3():
     result = m.integrate((2, 6), (0, 1), n_evaluations=500)
     analytic = 8 / 3 + (math.log(11664) - 4) / math.log(2)
     assert math.isclose(result, analytic, rel_tol=1e-5)
+
+
+def test_backends_equivalent():
+    expressions = ['2*x', '1', '4.2 + 1.5 * x^1.5 * log2^2(x)', '3 + 2 * x^0.5 * y^2 + -1.5 * log2(y)',
+                   '(2 * log2(x))*(0.5 + y^(1/3))']
+    for expression in expressions:
+        variables = ['x', 'y'] if 'y' in expression else ['x']
+        bounds = [(1, 64)] * len(variables)
+        _, expected = model.Model(expression, variables, backend='cexprtk').sample(*bounds, n_evaluations=20)
+        _, result = model.Model(expression, variables, backend='numpy').sample(*bounds, n_evaluations=20)
+        assert result.shape == expected.shape
+        assert np.allclose(result, expected, rtol=1e-12)
+
+
+def test_backend_fallback():
+    m = model.Model('max(x, 2)', ['x'], backend='numpy')
+    assert m.backend == 'cexprtk'
+    assert math.isclose(m.evaluate(1), 2)
+
+
+def test_evaluate_many():
+    for backend in model.BACKENDS:
+        m = model.Model('b*log2^2(a)', ['a', 'b'], backend=backend)
+        result = m.evaluate_many(np.array([[8, 2], [4, 1], [2, 3]]))
+        assert np.allclose(result, [18, 4, 3])
+
+
+def test_pickle():
+    for backend in model.BACKENDS:
+        m = pickle.loads(pickle.dumps(model.Model('b*log2^2(a)', ['a', 'b'], 'name', 0.5, backend=backend)))
+        assert m.name == 'name' and m.backend == backend
+        assert math.isclose(m.evaluate(8, 2), 18)
+
+
+def test_compiled_models_shared():
+    a = model.Model('2 * x^1.5', ['x'], 'a')
+    b = model.Model('2 * x^1.5', ['x'], 'b', 0.9)
+    assert a.compiled is b.compiled
+    assert (a.name, b.name, b.adj_r2) == ('a', 'b', 0.9)
+    assert model.Model('2 * x^1.5', ['x'], backend='cexprtk').compiled is not a._compiled
+    with pytest.raises(AttributeError):
+        a.model_str = 'x'
+
+
+def test_lazy_compilation():
+    m = pickle.loads(pickle.dumps(model.Model('2 * x^', ['x'], 'invalid')))
+    assert m.name == 'invalid' and m.variables == ['x']
+    with pytest.raises(Exception):
+        m.evaluate(1)
+
+    m = model.Model.from_serializable(model.Model('b*log2^2(a)', ['a', 'b'], 'name', 0.5).serializable())
+    assert (m.name, m.adj_r2, m.variables) == ('name', 0.5, ['a', 'b'])
+    assert math.isclose(m.evaluate(8, 2), 18)
+
+
+def test_evaluate_threads():
+    m = model.Model('x * y + log2(x)', ['x', 'y'], backend='cexprtk')
+    points = np.random.default_rng(0).uniform(1, 100, (2000, 2))
+    expected = points[:, 0] * points[:, 1] + np.log2(points[:, 0])
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda p: m.evaluate(*p), points))
+    assert np.allclose(results, expected)
+
+
+def test_cexprtk_compiled_on_demand():
+    compiled = model.Model('2*x^2', ['x'], backend='numpy').compiled
+    assert compiled.backend == 'numpy' and compiled._scalar is None
+    assert math.isclose(compiled.scalar(3), 18)
+    assert model.Model('2*x^3', ['x'], backend='cexprtk').compiled._scalar is not None
@@ -1,5 +1,7 @@
 import math
 
+import numpy as np
+
 from md_perfmod.models import comparison
 from md_perfmod.models.model import Model
 
@@ -27,3 +29,15 @@ def test_calculate_error2():
     err, err_c, err_min, err_max = comparison.calculate_error(two_d, two_d, (0, 5), (0, 5), n_samples=10, rel=False)
     assert err == 0
     assert err_c == 100
+
+
+def test_classification_errors_match_pointwise():
+    two_d = [Model('4', ['x', 'y'], 'A'), Model('x+y', ['x', 'y'], 'B'), Model('x*y^0.5', ['x', 'y'], 'C')]
+    combined = [comparison.combine(Model('2', ['x']), Model('2', ['y']), 'A'),
+                comparison.combine(Model('x', ['x']), Model('1', ['y']), 'B'),
+                comparison.combine(Model('x^0.7', ['x']), Model('y', ['y']), 'C')]
+    points = comparison.sample_points([(0, 5), (0, 5)], 7)
+    for best in (min, max):
+        errors = comparison.classification_errors(two_d, combined, points, best=best)
+        expected = [comparison.distance_to_real_best(two_d, combined, p, best=best) for p in points]
+        assert np.allclose(errors, expected)
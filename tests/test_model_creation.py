@@ -0,0 +1,61 @@
+import itertools
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from md_perfmod.models import pmnf
+from md_perfmod.visualizer import model_creation
+
+
+@pytest.mark.skipif(not model_creation.worker_timeouts, reason='needs SIGALRM')
+def test_run_timed():
+    with pytest.raises(model_creation.TimeoutError):
+        model_creation.run_timed(0.1, time.sleep, 5)
+    assert model_creation.run_timed(1, abs, -2) == 2
+
+
+@pytest.mark.skipif(not model_creation.worker_timeouts, reason='needs SIGALRM')
+def test_collect_stops_hanging_fits(monkeypatch):
+    monkeypatch.setattr(model_creation, 'fit_timeout', 0.2)
+    start = time.time()
+    futures = [model_creation.submit_timed(time.sleep, 30), model_creation.submit_timed(abs, -2)]
+    assert model_creation.collect(futures) == [None, 2]
+    assert time.time() - start < 10
+    # the worker is free again
+    assert model_creation.run_all(abs, [(-3,)]) == [3]
+
+
+def test_unexpected_output_fails_fit():
+    with pytest.raises(model_creation.FitError):
+        model_creation.parse(r'model: (.+)\n', 'error\n', 'extrap-print')
+    futures = [model_creation.submit_timed(model_creation.parse, r'model: (.+)\n', 'error\n', 'extrap-print')]
+    assert model_creation.collect(futures) == [None]
+
+
+def make_data():
+    rows = [(t, a, b, c, (2 if t == 'x' else 3) * a * b + c)
+            for t, a, b, c in itertools.product(['x', 'y'], [1, 2, 4, 8], [1, 2, 3, 4], [1, 2, 3])]
+    return pd.DataFrame(rows, columns=['t', 'a', 'b', 'c', 'time'])
+
+
+def test_native_fits_of_many_variables(monkeypatch):
+    data = make_data()
+    models = model_creation.create(data, ['a', 'b', 'c'], 'time', None, 't', ['x', 'y'], {}, modeler='native')
+    assert [m.name for m in models] == ['x', 'y']
+
+    # the searches in the worker pool are stopped like the other fits
+    if model_creation.worker_timeouts:
+        monkeypatch.setattr(model_creation, 'fit_timeout', 1e-4)
+        assert model_creation.create(data, ['a', 'b', 'c'], 'time', None, 't', ['x', 'y'], {}, modeler='native') == []
+
+
+def test_numerical_errors_fail_fit(monkeypatch):
+    def singular(*args, **kwargs):
+        raise np.linalg.LinAlgError('Singular matrix')
+
+    monkeypatch.setattr(pmnf, 'fit', singular)
+    grouped = model_creation.grouped_conversion(make_data(), ['a', 'b', 'c'], {'t': 'x'}, 'time', None)
+    with pytest.raises(model_creation.FitError):
+        model_creation.fit_native(grouped, ['a', 'b', 'c'])
@@ -0,0 +1,86 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from md_perfmod.models.model import Model
+from md_perfmod.visualizer import model_index
+
+
+def make_data():
+    rows = []
+    for t, x, y, r in itertools.product(['c08', 'c04'], [1, 2, 4, 8, 16], [1, 2, 3, 4, 5], range(3)):
+        rows.append((t, x, y, r, (2 if t == 'c08' else 3) * x + y * y + 0.01 * r))
+    return pd.DataFrame(rows, columns=['traversal', 'x', 'y', 'repeat', 'time'])
+
+
+def test_classify_columns():
+    selectable, values, metrics = model_index.classify_columns(make_data())
+    assert selectable == ['traversal', 'x', 'y', 'repeat']
+    assert [len(v) for v in values] == [2, 5, 5, 3]
+    assert metrics == ['time']
+
+
+def test_index_key_ignores_selected_sliders():
+    columns = ['traversal', 'x', 'y']
+    key = model_index.index_key('models', ['x', None, 'time', None, None, -1, 4, np.int64(2)], columns)
+    assert key == model_index.index_key('models', ['x', None, 'time', None, None, -1, 8, 2.0], columns)
+    assert key != model_index.index_key('models', ['x', None, 'time', None, None, -2, 4, 2], columns)
+
+
+def test_selections():
+    data = make_data()
+    selectable, values, metrics = model_index.classify_columns(data)
+    selections = list(model_index.selections(selectable, values, metrics, compare=[None, 'traversal'],
+                                             repeat='repeat', max_variables=1))
+    # x or y: 2 traversals * 5 values of the other variable without compare and 5 values with compare
+    assert len(selections) == 2 * (10 + 5)
+    assert ['x', None, 'time', 'traversal', 'repeat', None, None, 1, None] in selections
+    assert all(s[-1] is None for s in selections)
+
+
+def test_precompute_matches_dashboard(tmpdir):
+    data = make_data()
+    selectable, values, metrics = model_index.classify_columns(data)
+    selection = ['x', 'y', 'time', 'traversal', 'repeat', None, None, None, None]
+    entries = model_index.precompute(data, [selection], modeler='native', use_cache=False)
+
+    file = str(tmpdir.join('index.json'))
+    model_index.write_index(file, entries)
+    entries = model_index.load_index(file)
+    assert model_index.load_index(str(tmpdir.join('missing.json'))) == {}
+
+    models = [Model.from_serializable(m) for m in entries[model_index.index_key('models', selection, selectable)]]
+    assert [m.name for m in models] == ['c08', 'c04']
+    assert models[0].variables == ['x', 'y']
+
+    one_d = model_index.combined_selections(selection, selectable, values)
+    assert one_d[0][:2] == ['x', None] and one_d[0][5 + selectable.index('y')] == 3
+    assert model_index.index_key('models', one_d[1], selectable) in entries
+
+    combined = entries[model_index.index_key('combined', selection, selectable)]
+    assert [m['identifier'] for m in combined] == ['c08', 'c04']
+    assert Model.from_serializable(combined[0]).evaluate(4, 2) > 0
+
+
+def test_index_of_changed_data_is_ignored(tmpdir):
+    data = tmpdir.join('data.csv')
+    make_data().to_csv(str(data), index=False)
+    index = str(tmpdir.join('index.json'))
+    model_index.write_index(index, {'key': []}, str(data), 'native')
+    assert model_index.load_index(index, str(data)) == {'key': []}
+
+    # the result file is regenerated
+    make_data().iloc[:-1].to_csv(str(data), index=False)
+    with pytest.warns(UserWarning):
+        assert model_index.load_index(index, str(data)) == {}
+
+
+def test_precompute_in_batches(monkeypatch):
+    data = make_data()
+    selection_list = [['x', None, 'time', 'traversal', 'repeat', None, None, y, None] for y in range(1, 6)]
+    entries = model_index.precompute(data, selection_list, modeler='native', use_cache=False)
+    monkeypatch.setattr(model_index, 'max_pending', 2)
+    assert model_index.precompute(data, selection_list, modeler='native', use_cache=False) == entries
+    assert len(entries) == 5
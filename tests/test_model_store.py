@@ -0,0 +1,33 @@
+import numpy as np
+
+from md_perfmod.models.model import Model
+from md_perfmod.visualizer.model_store import ModelStore, parse_key, selection_key
+
+
+def test_selection_key():
+    key = selection_key('models', 'x', None, np.int64(3), 2.5)
+    assert parse_key(key) == ('models', ['x', None, 3, 2.5])
+    assert key == selection_key('models', 'x', None, 3, 2.5)
+
+
+def test_lru_eviction():
+    store = ModelStore(max_entries=2)
+    store.put('a', [Model('x', ['x'], 'a')])
+    store.put('b', [])
+    assert store.get('a')[0].name == 'a'  # a is now more recently used than b
+    store.put('c', [])
+    assert store.get('b') is None and store.get('a') is not None and len(store) == 2
+
+
+def test_get_or_create():
+    store = ModelStore()
+    created = []
+
+    def create(kind, selection):
+        created.append((kind, selection))
+        return [Model('x', ['x'], selection[0])]
+
+    key = selection_key('models', 'x')
+    assert store.get_or_create(key, create)[0].name == 'x'
+    assert store.get_or_create(key, create)[0].name == 'x'
+    assert created == [('models', ['x'])]
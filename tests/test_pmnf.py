@@ -0,0 +1,58 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from md_perfmod.models import pmnf
+
+
+def grid(*axes):
+    return np.stack([g.ravel() for g in np.meshgrid(*axes, indexing='ij')], axis=1)
+
+
+def test_partitions():
+    assert sorted(map(sorted, pmnf.partitions([0, 1]))) == [[(0,), (1,)], [(0, 1)]]
+    assert len(list(pmnf.partitions([0, 1, 2]))) == 5
+
+
+def test_one_parameter():
+    x = np.array([[1], [2], [4], [8], [16], [32]])
+    m = pmnf.fit(x, 3 + 2 * x[:, 0] ** 1.5 * np.log2(x[:, 0]), ['p'])
+    assert np.isclose(m.adj_r2, 1)
+    assert np.allclose(m.evaluate_many(x), 3 + 2 * x[:, 0] ** 1.5 * np.log2(x[:, 0]))
+    assert 'log2' in m.model_str
+
+
+def test_constant():
+    x = np.array([[1], [2], [4], [8]])
+    m = pmnf.fit(x, [5, 5, 5, 5], ['p'])
+    assert np.isclose(m.evaluate(3), 5)
+
+
+def test_two_parameters_multiplicative():
+    points = grid([1, 2, 4, 8, 16], [1, 2, 3, 4, 5])
+    values = 1 + 0.5 * points[:, 0] ** 2 * points[:, 1] ** 0.5
+    m = pmnf.fit(points, values, ['x', 'y'])
+    assert np.allclose(m.evaluate_many(points), values)
+
+
+def test_two_parameters_additive():
+    points = grid([1, 2, 4, 8, 16], [1, 2, 3, 4, 5])
+    values = 1 + 0.5 * points[:, 0] ** 2 + 3 * np.log2(points[:, 1])
+    m = pmnf.fit(points, values, ['x', 'y'])
+    assert np.allclose(m.evaluate_many(points), values)
+
+
+def test_more_parameters():
+    points = grid([1, 2, 4, 8], [1, 2, 3, 4], [2, 4, 6, 8], [1, 2, 3, 4, 5])
+    values = 2 + points[:, 0] * points[:, 1] + 0.1 * points[:, 2] ** 2
+    m = pmnf.fit(points, values, ['a', 'b', 'c', 'd'])
+    assert np.allclose(m.evaluate_many(points), values)
+
+
+def test_parallel_search():
+    points = grid([1, 2, 4, 8], [1, 2, 3, 4], [2, 4, 6, 8])
+    values = 3 + 0.5 * points[:, 0] * np.log2(points[:, 2]) + points[:, 1] ** 2
+    with ThreadPoolExecutor(2) as executor:
+        parallel = pmnf.fit(points, values, ['a', 'b', 'c'], executor=executor)
+    assert parallel.model_str == pmnf.fit(points, values, ['a', 'b', 'c']).model_str
+    assert np.allclose(parallel.evaluate_many(points), values)
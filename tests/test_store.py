@@ -0,0 +1,31 @@
+import pandas as pd
+import pytest
+
+import md_perfmod.csv2extrap as cv
+import md_perfmod.csv2store as cs
+
+pytest.importorskip('pyarrow')
+
+df = pd.DataFrame({'traversal': ['c08', 'c04', 'c08', 'c04', 'c08', 'c04'],
+                   'density': [0.1, 0.1, 0.3, 0.3, 0.5, 0.5],
+                   'time': [1.0, 2.0, 3.0, 4.0, 5.0, 6.0]})
+
+
+@pytest.mark.parametrize('extension', ['.parquet', '.feather'])
+def test_round_trip(tmp_path, extension):
+    path = str(tmp_path / ('data' + extension))
+    cs.store(cs.encode(df), path)
+    data = cs.load(path)
+    assert data['traversal'].dtype == 'category'
+    assert data['traversal'].astype(str).tolist() == df['traversal'].tolist()
+    assert data['time'].tolist() == df['time'].tolist()
+
+
+@pytest.mark.parametrize('extension', ['.parquet', '.feather'])
+def test_read_selected(tmp_path, extension):
+    path = str(tmp_path / ('data' + extension))
+    cs.store(cs.encode(df), path)
+    data = cv.read_selected(path, ['traversal', 'time'], {'density': '0.3'}, None)
+    assert sorted(data['time'].tolist()) == [3.0, 4.0]
+    result = cv.conversion_by(cs.load(path), ['density'], {}, 'time', None, 'traversal')
+    assert result['c04'] == {(0.1,): [2.0], (0.3,): [4.0], (0.5,): [6.0]}